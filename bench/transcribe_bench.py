@@ -0,0 +1,298 @@
+"""
+offline load test for the transcription pipeline.
+
+serves synthetic ogg/opus voice notes from a local http server (standing in for
+the discord cdn), drives Transcriber._transcribe_message with stub interactions
+and swaps the recognizer and deepl for local fakes with configurable latency.
+
+    python bench/transcribe_bench.py --requests 200 --concurrency 16
+
+needs ffmpeg on PATH, same as the bot itself.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+
+# the bench measures the pipeline, not the caches or limits in front of it
+os.environ.setdefault("DEEPL_API_KEY", "bench:fx")
+os.environ["RATE_LIMIT_USER"] = ""
+os.environ["RATE_LIMIT_GUILD"] = ""
+os.environ["RATE_LIMIT_GLOBAL"] = ""
+os.environ["PREFETCH_SELECTED"] = "false"
+
+import discord
+from aiohttp import web
+from discord.ext import commands
+
+from utils.recognizers import Recognition
+from utils.voice_note import VoiceNote
+
+
+class FakeBackend:
+    name = "fake"
+    uses_language_hint = False
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def recognize(self, pcm: bytes, languages=()) -> Recognition:
+        time.sleep(self.latency)
+        return Recognition(f"recognized {len(pcm)} bytes of audio", "en")
+
+
+class FakeTranslation:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeDeepL:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def translate_text(self, text, target_lang):
+        time.sleep(self.latency)
+        return FakeTranslation(f"[{target_lang}] {text}")
+
+    def close(self):
+        pass
+
+
+class FakeMessage:
+    id = 0
+
+    async def edit(self, **kwargs):
+        pass
+
+    async def delete(self):
+        pass
+
+
+class FakeResponse:
+    def __init__(self):
+        self.done = False
+        self.rejected = False
+
+    def is_done(self):
+        return self.done
+
+    async def defer(self, **kwargs):
+        self.done = True
+
+    async def send_message(self, *args, **kwargs):
+        # only rejections are sent as initial responses by the pipeline
+        self.done = True
+        self.rejected = True
+
+
+class FakeFollowup:
+    def __init__(self):
+        self.errors = []
+
+    async def send(self, content=None, **kwargs):
+        if content is not None:
+            self.errors.append(content)
+        return FakeMessage()
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"user{user_id}"
+
+
+class FakeInteraction:
+    def __init__(self, user_id, guild_id=None):
+        self.id = user_id
+        self.application_id = 1
+        self.token = f"token{user_id}"
+        self.created_at = discord.utils.utcnow()
+        self.user = FakeUser(user_id)
+        self.guild_id = guild_id
+        self.guild = None
+        self.locale = discord.Locale.american_english
+        self.guild_locale = None
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+
+
+def make_voice_note(path: str, seconds: int):
+    # a tone that is on for 3 seconds and off for 1, so silence splitting has work to do
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-loglevel",
+            "error",
+            "-y",
+            "-f",
+            "lavfi",
+            "-i",
+            f"sine=frequency=220:duration={seconds}",
+            "-af",
+            "volume='if(lt(mod(t,4),3),1,0)':eval=frame",
+            "-ac",
+            "1",
+            "-c:a",
+            "libopus",
+            "-b:a",
+            "32k",
+            "-f",
+            "ogg",
+            path,
+        ],
+        check=True,
+    )
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on linux, children covers the ffmpeg processes
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own / 1024, children / 1024
+
+
+async def run(args):
+    workdir = tempfile.mkdtemp(prefix="vmt-bench-")
+    files = {}
+    for seconds in args.lengths:
+        path = os.path.join(workdir, f"{seconds}s.ogg")
+        make_voice_note(path, seconds)
+        files[seconds] = path
+
+    app = web.Application()
+
+    async def serve(request):
+        return web.FileResponse(files[int(request.match_info["seconds"])])
+
+    app.router.add_get("/{seconds}.ogg", serve)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+
+    bot = commands.Bot(command_prefix="!", intents=discord.Intents.default())
+    bot.speech_backend = FakeBackend(args.recognizer_latency)
+    bot.command_ids = {}
+    await bot.load_extension("cogs.transcribe")
+    cog = bot.get_cog("Transcriber")
+    cog.translator.deepl = FakeDeepL(args.translation_latency)
+
+    latencies = []
+    failures = 0
+    rejected = 0
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def one(index):
+        nonlocal failures, rejected
+        seconds = args.lengths[index % len(args.lengths)]
+        # a distinct attachment per request so every run goes through the whole pipeline
+        note = VoiceNote(
+            channel_id=1,
+            message_id=index,
+            attachment_id=index if args.unique else seconds,
+            url=f"http://127.0.0.1:{args.port}/{seconds}.ogg",
+            size=os.path.getsize(files[seconds]),
+            duration=float(seconds),
+            author_name="bench",
+        )
+        interaction = FakeInteraction(index, guild_id=1)
+        async with slots:
+            start = time.perf_counter()
+            await cog._transcribe_message(interaction, note, args.translate_to)
+            latencies.append(time.perf_counter() - start)
+        if interaction.response.rejected:
+            rejected += 1
+        elif interaction.followup.errors:
+            failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    await bot.unload_extension("cogs.transcribe")
+    await runner.cleanup()
+
+    own_rss, children_rss = peak_rss_mb()
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "failures": failures,
+        "rejected": rejected,
+        "elapsed_seconds": round(elapsed, 3),
+        "requests_per_second": round(args.requests / elapsed, 2),
+        "p50_seconds": round(percentile(latencies, 50), 4),
+        "p95_seconds": round(percentile(latencies, 95), 4),
+        "p99_seconds": round(percentile(latencies, 99), 4),
+        "peak_rss_mb": round(own_rss, 1),
+        "peak_child_rss_mb": round(children_rss, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument(
+        "--lengths",
+        type=lambda value: [int(part) for part in value.split(",")],
+        default=[5, 30, 60],
+        help="voice note lengths in seconds, comma separated",
+    )
+    parser.add_argument("--recognizer-latency", type=float, default=0.3)
+    parser.add_argument("--translation-latency", type=float, default=0.1)
+    parser.add_argument("--translate-to", default=None)
+    parser.add_argument(
+        "--no-unique",
+        dest="unique",
+        action="store_false",
+        help="reuse attachment ids so repeat requests hit the transcript cache",
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--json", action="store_true", help="print results as json")
+    parser.add_argument("--max-p95", type=float, help="fail if p95 exceeds this")
+    parser.add_argument(
+        "--max-rss-mb", type=float, help="fail if peak rss exceeds this"
+    )
+    args = parser.parse_args()
+
+    # admit everything the bench throws at it, rejections would skew the numbers
+    os.environ.setdefault("TRANSCRIBE_QUEUE_SIZE", str(args.requests))
+    if args.unique:
+        os.environ.setdefault("TRANSCRIPT_CACHE_SIZE", "0")
+
+    results = asyncio.run(run(args))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for key, value in results.items():
+            print(f"{key:>22}: {value}")
+
+    failed = results["failures"] > 0
+    if args.max_p95 is not None and results["p95_seconds"] > args.max_p95:
+        print(f"p95 {results['p95_seconds']}s is over the {args.max_p95}s budget")
+        failed = True
+    if args.max_rss_mb is not None and results["peak_rss_mb"] > args.max_rss_mb:
+        print(
+            f"peak rss {results['peak_rss_mb']}MB is over the {args.max_rss_mb}MB budget"
+        )
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import argparse
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+import discord
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+# empty means auto too, .env.example leaves it blank
+SHARD_COUNT = os.getenv("SHARD_COUNT") or "auto"
+MAIN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+log = logging.getLogger("vmt.cluster")
+
+
+def recommended_shard_count() -> int:
+    request = urllib.request.Request(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={
+            "Authorization": f"Bot {BOT_TOKEN}",
+            "User-Agent": "vmt (https://github.com/originoidco/vmt)",
+        },
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.load(response)["shards"]
+
+
+def shard_groups(shard_count: int, clusters: int):
+    # contiguous groups, as even as possible
+    size, extra = divmod(shard_count, clusters)
+    groups = []
+    start = 0
+    for cluster_id in range(clusters):
+        end = start + size + (1 if cluster_id < extra else 0)
+        groups.append(list(range(start, end)))
+        start = end
+    return [group for group in groups if group]
+
+
+def set_default(env: dict, key: str, value: str):
+    # a key left empty in .env still gets the shared default
+    if not env.get(key):
+        env[key] = value
+
+
+def cluster_env(cluster_id: int, shard_ids, shard_count: int, state_dir: str):
+    env = dict(os.environ)
+    env["CLUSTER_ID"] = str(cluster_id)
+    env["SHARD_IDS"] = ",".join(str(shard_id) for shard_id in shard_ids)
+    env["SHARD_COUNT"] = str(shard_count)
+
+    # selections and transcripts are shared through sqlite so any process can answer
+    set_default(env, "TRANSCRIPT_CACHE_DB", os.path.join(state_dir, "transcripts.db"))
+    set_default(env, "SELECTION_DB", os.path.join(state_dir, "selections.db"))
+    set_default(env, "AUTO_TRANSCRIBE_DB", os.path.join(state_dir, "settings.db"))
+    # one set of rate limit buckets, a user's servers can be spread over several processes
+    set_default(env, "RATE_LIMIT_DB", os.path.join(state_dir, "ratelimit.db"))
+    set_default(env, "COMMAND_SYNC_STATE", os.path.join(state_dir, "command_sync.json"))
+    # each process resumes only the jobs it was running itself
+    env["JOB_JOURNAL_DB"] = os.path.join(state_dir, f"jobs-{cluster_id}.db")
+
+    if os.getenv("METRICS_PORT"):
+        env["METRICS_PORT"] = str(int(os.getenv("METRICS_PORT")) + cluster_id)
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run vmt as several processes, each owning a group of shards."
+    )
+    parser.add_argument(
+        "--clusters",
+        type=int,
+        default=int(os.getenv("CLUSTER_COUNT") or os.cpu_count() or 1),
+        help="number of worker processes (default: CLUSTER_COUNT or the cpu count)",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=0 if SHARD_COUNT == "auto" else int(SHARD_COUNT),
+        help="total shard count (default: SHARD_COUNT or discord's recommendation)",
+    )
+    parser.add_argument(
+        "--state-dir",
+        default=os.getenv("CLUSTER_STATE_DIR", "data"),
+        help="directory for the sqlite files shared between processes",
+    )
+    parser.add_argument(
+        "--force-sync",
+        action="store_true",
+        help="have the first cluster sync slash commands even if they look unchanged",
+    )
+    args = parser.parse_args()
+
+    discord.utils.setup_logging(root=True)
+
+    if not BOT_TOKEN:
+        raise ValueError(
+            "BOT_TOKEN not found in environment variables! Please set it in your .env file"
+        )
+
+    shard_count = args.shards or recommended_shard_count()
+    groups = shard_groups(shard_count, max(1, args.clusters))
+    os.makedirs(args.state_dir, exist_ok=True)
+    log.info("starting clusters=%s shards=%s", len(groups), shard_count)
+
+    def start(cluster_id, force_sync=False):
+        env = cluster_env(cluster_id, groups[cluster_id], shard_count, args.state_dir)
+        log.info("starting cluster=%s shards=%s", cluster_id, groups[cluster_id])
+        command = [sys.executable, MAIN_PATH]
+        if force_sync:
+            command.append("--force-sync")
+        return subprocess.Popen(command, env=env)
+
+    # a forced sync only on the first start, restarts after a crash don't need one
+    processes = {
+        cluster_id: start(cluster_id, args.force_sync and cluster_id == 0)
+        for cluster_id in range(len(groups))
+    }
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes.values():
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while not stopping:
+        time.sleep(1)
+        for cluster_id, process in list(processes.items()):
+            if process.poll() is not None and not stopping:
+                log.warning(
+                    "cluster exited cluster=%s code=%s, restarting",
+                    cluster_id,
+                    process.returncode,
+                )
+                time.sleep(5)
+                processes[cluster_id] = start(cluster_id)
+
+    for process in processes.values():
+        process.wait()
+
+
+if __name__ == "__main__":
+    main()
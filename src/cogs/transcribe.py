@@ -1,27 +1,177 @@
-import io
-import json
+import asyncio
+import logging
+import math
+import time
 import typing
 import os
 
+import aiohttp
 import discord
 from discord import app_commands
 from discord.ext import commands
-import pydub
 import speech_recognition as sr
-import deepl
+
+from utils import metrics
+from utils.audio import (
+    SAMPLE_RATE,
+    SAMPLE_WIDTH,
+    AttachmentTooLarge,
+    PreprocessOptions,
+    decode_attachment,
+    preprocess,
+    split_on_silence,
+)
+from utils.cache import (
+    TTLCache,
+    TieredCache,
+    TranscriptCache,
+    attachment_key,
+    language_key,
+)
+from utils.config import get_language_index, load_config
+from utils.jobs import Job, JobJournal
+from utils.ratelimit import RateLimiter, parse_rate
+from utils.recognizers import Recognition, SpeechBackend, load_backend
+from utils.resilience import CircuitOpenError, Upstream
+from utils.translation import Translator, same_language
+from utils.settings import GuildSettings
+from utils.singleflight import SingleFlight
+from utils.voice_note import Admission, VoiceNote, admit
+from utils.workers import AudioWorkerPool, BackgroundQueue, PoolBusyError
+
+log = logging.getLogger(__name__)
+
+TRUNCATED_NOTE = "Too long to show in full, the text was cut"
 
 
 class Transcriber(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.config = self.load_config()
+        self.config = load_config()
+        self.language_index = get_language_index()
         self.deepl_api_key = os.getenv("DEEPL_API_KEY")
         self.max_duration = int(os.getenv("MAX_VOICE_MESSAGE_DURATION", "60"))
+        self.max_bytes = int(
+            os.getenv("MAX_VOICE_MESSAGE_BYTES", str(10 * 1024 * 1024))
+        )
+        # "truncate" transcribes the first MAX_VOICE_MESSAGE_DURATION seconds of longer messages
+        self.truncate_overlong = (
+            os.getenv("OVERLONG_VOICE_MESSAGES", "reject").lower() == "truncate"
+        )
+        # languages voice messages are expected in, the locale picks which is tried first
+        self.speech_languages = [
+            code.strip()
+            for code in os.getenv("SPEECH_LANGUAGES", "").split(",")
+            if code.strip()
+        ]
+        self.max_translations = int(os.getenv("MAX_TRANSLATION_TARGETS", "5"))
+        self.chunk_seconds = float(os.getenv("TRANSCRIBE_CHUNK_SECONDS", "15"))
+        self.preprocess_options = PreprocessOptions(
+            trim_silence=os.getenv("AUDIO_TRIM_SILENCE", "true").lower() == "true",
+            normalize=os.getenv("AUDIO_NORMALIZE", "true").lower() == "true",
+            silence_threshold=float(os.getenv("AUDIO_SILENCE_THRESHOLD", "-45")),
+        )
+
+        failure_threshold = int(os.getenv("BREAKER_FAILURES", "5"))
+        reset_after = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
 
         deepl_free_api = os.getenv("DEEPL_FREE_API", "false").lower() == "true"
         self.deepl_server_url = "https://api-free.deepl.com" if deepl_free_api else None
+        self.translator = Translator(
+            self.deepl_api_key,
+            server_url=self.deepl_server_url,
+            cache_size=int(os.getenv("TRANSLATION_CACHE_SIZE", "1024")),
+            cache_ttl=float(os.getenv("TRANSLATION_CACHE_TTL", "86400")),
+            timeout=float(os.getenv("TRANSLATE_TIMEOUT", "10")),
+            hedge_after=float(os.getenv("TRANSLATE_HEDGE_SECONDS", "3")),
+            workers=int(os.getenv("TRANSLATE_WORKERS", "4")),
+            failure_threshold=failure_threshold,
+            reset_after=reset_after,
+        )
 
-        self.selected_messages = {}
+        # user id -> VoiceNote, bounded so idle users don't keep memory forever
+        selection_db = os.getenv("SELECTION_DB") or None
+        self.selected_messages = TieredCache(
+            "selections",
+            # a shared db is the source of truth, another cluster process may have
+            # changed the selection since it was last seen here
+            max_size=(
+                0 if selection_db else int(os.getenv("SELECTION_CACHE_SIZE", "10000"))
+            ),
+            ttl=float(os.getenv("SELECTION_TTL", "3600")),
+            db_path=selection_db,
+            encode=VoiceNote.to_json,
+            decode=VoiceNote.from_json,
+        )
+
+        self.pool = AudioWorkerPool(
+            decode_workers=int(os.getenv("DECODE_WORKERS", "2")),
+            recognize_workers=int(os.getenv("RECOGNIZE_WORKERS", "4")),
+            max_queue=int(os.getenv("TRANSCRIBE_QUEUE_SIZE", "16")),
+        )
+        metrics.QUEUE_DEPTH.set_function(lambda: self.pool.pending)
+        self.rate_limiter = RateLimiter(
+            user=parse_rate(os.getenv("RATE_LIMIT_USER", "5/60")),
+            guild=parse_rate(os.getenv("RATE_LIMIT_GUILD", "30/60")),
+            global_=parse_rate(os.getenv("RATE_LIMIT_GLOBAL")),
+            db_path=os.getenv("RATE_LIMIT_DB") or None,
+        )
+        # user id -> attachment id of a selection whose prefetch already spent a token,
+        # the /transcribe that follows it is free
+        self.prefetched = TTLCache(
+            int(os.getenv("SELECTION_CACHE_SIZE", "10000")),
+            float(os.getenv("SELECTION_TTL", "3600")),
+        )
+        self.transcript_cache = TranscriptCache(
+            max_size=int(os.getenv("TRANSCRIPT_CACHE_SIZE", "512")),
+            ttl=float(os.getenv("TRANSCRIPT_CACHE_TTL", "86400")),
+            db_path=os.getenv("TRANSCRIPT_CACHE_DB") or None,
+        )
+
+        self.session = None
+
+        # (attachment id, languages) -> the pipeline run in progress, whoever started it
+        self.transcriptions = SingleFlight("transcription")
+        # start transcribing when a message is selected, /transcribe then joins that run
+        self.prefetch_selected = (
+            os.getenv("PREFETCH_SELECTED", "true").lower() == "true"
+        )
+
+        # servers can opt in to having new voice messages transcribed as they arrive
+        self.guild_settings = GuildSettings(os.getenv("AUTO_TRANSCRIBE_DB") or None)
+        self.background = BackgroundQueue(
+            per_guild=int(os.getenv("AUTO_TRANSCRIBE_GUILD_CONCURRENCY", "1")),
+            max_queued=int(os.getenv("AUTO_TRANSCRIBE_GUILD_QUEUE", "10")),
+        )
+        metrics.BACKGROUND_QUEUE_DEPTH.set_function(lambda: len(self.background))
+        self.background_worker_count = int(os.getenv("AUTO_TRANSCRIBE_WORKERS", "2"))
+        self.background_workers = []
+
+        # deferred /transcribe jobs are journaled so a restart can still answer them
+        journal_db = os.getenv("JOB_JOURNAL_DB") or None
+        self.journal = JobJournal(journal_db) if journal_db else None
+        self.drain_seconds = float(os.getenv("JOB_DRAIN_SECONDS", "20"))
+        self.draining = False
+        # interaction id -> task running it, waited on by drain()
+        self.jobs = {}
+        self.resume_task = None
+
+        # loaded once in Bot.setup_hook and shared by every recognizer worker
+        self.speech_backend = getattr(bot, "speech_backend", None) or load_backend()
+        # per chunk deadline, hedged retries for slow calls and a circuit breaker
+        remote = getattr(self.speech_backend, "remote", False)
+        self.recognizer = Upstream(
+            self.speech_backend.name,
+            timeout=float(os.getenv("RECOGNIZE_TIMEOUT", "30")),
+            hedge_after=float(
+                os.getenv("RECOGNIZE_HEDGE_SECONDS", "4" if remote else "0")
+            ),
+            attempts=2 if remote else 1,
+            failure_threshold=failure_threshold,
+            reset_after=reset_after,
+            # an empty result is an answer, not a sign the upstream is unhealthy
+            answers=(sr.UnknownValueError,),
+        )
 
         self.select_menu = app_commands.ContextMenu(
             name="Select Voice Message",
@@ -35,93 +185,310 @@ class Transcriber(commands.Cog):
         )
         self.bot.tree.add_command(self.select_menu)
 
+        self.transcribe_menu = app_commands.ContextMenu(
+            name="Transcribe",
+            callback=self.transcribe_voice_message,
+        )
+        self.transcribe_menu.allowed_installs = app_commands.AppInstallationType(
+            guild=True, user=True
+        )
+        self.transcribe_menu.allowed_contexts = app_commands.AppCommandContext(
+            guild=True, dm_channel=True, private_channel=True
+        )
+        self.bot.tree.add_command(self.transcribe_menu)
+
+    async def cog_load(self):
+        # used to stream attachments straight into ffmpeg
+        self.session = aiohttp.ClientSession()
+
+        if self.journal is not None:
+            self.resume_task = asyncio.create_task(self.resume_jobs())
+
+        self.background_workers = [
+            asyncio.create_task(self.background_worker())
+            for _ in range(self.background_worker_count)
+        ]
+
     async def cog_unload(self):
         self.bot.tree.remove_command(self.select_menu.name, type=self.select_menu.type)
-
-    def load_config(self):
-        config_path = os.path.join(
-            os.path.dirname(os.path.dirname(__file__)), "config", "config.json"
+        self.bot.tree.remove_command(
+            self.transcribe_menu.name, type=self.transcribe_menu.type
         )
-        with open(config_path) as conf_file:
-            return json.load(conf_file)
+        self.transcriptions.cancel_all()
+        if self.resume_task is not None:
+            self.resume_task.cancel()
+        for task in self.background_workers:
+            task.cancel()
+        self.pool.shutdown()
+        stats = self.transcript_cache.stats()
+        log.info(
+            "transcript cache hits=%s misses=%s size=%s",
+            stats["hits"],
+            stats["misses"],
+            stats["size"],
+        )
+        self.transcript_cache.close()
+        self.selected_messages.close()
+        if self.journal is not None:
+            self.journal.close()
+        self.guild_settings.close()
+        self.rate_limiter.close()
+        self.translator.close()
+        await self.session.close()
 
-    async def select_voice_message(
+    def admit(self, note: VoiceNote) -> Admission:
+        return admit(note, self.max_duration, self.max_bytes, self.truncate_overlong)
+
+    async def check_voice_message(
         self, interaction: discord.Interaction, message: discord.Message
-    ):
-        if not message.attachments or not (message.flags.value & (1 << 13)):
+    ) -> typing.Optional[VoiceNote]:
+        if not msg_has_voice_note(message):
             await interaction.response.send_message(
                 "This message does not contain a voice message.", ephemeral=True
             )
+            return None
+
+        note = VoiceNote.from_message(message)
+        admission = self.admit(note)
+        if not admission.allowed:
+            await interaction.response.send_message(admission.reason, ephemeral=True)
+            return None
+
+        return note
+
+    async def select_voice_message(
+        self, interaction: discord.Interaction, message: discord.Message
+    ):
+        note = await self.check_voice_message(interaction, message)
+        if note is None:
             return
 
-        attachment = message.attachments[0]
-        duration = getattr(attachment, "duration_secs", None)
-        if duration and duration > self.max_duration:
+        await self.selected_messages.set(interaction.user.id, note)
+        await interaction.response.send_message(
+            f"Voice message selected! Use /transcribe to transcribe it.", ephemeral=True
+        )
+
+        # get a head start so the transcript is ready by the time /transcribe arrives,
+        # paid for up front so selecting can't download more than transcribing could
+        if (
+            self.prefetch_selected
+            and not self.pool.is_full()
+            and not self.draining
+            and not await self.acquire_rate_limit(
+                interaction.user.id, interaction.guild_id
+            )
+        ):
+            self.prefetched.set(interaction.user.id, note.attachment_id)
+            self.start_prefetch(
+                note, self.languages_for(interaction.guild_locale or interaction.locale)
+            )
+
+    async def acquire_rate_limit(
+        self, user_id: int, guild_id: typing.Optional[int]
+    ) -> float:
+        # buckets shared between cluster processes live in sqlite, which blocks
+        if self.rate_limiter.db is None:
+            return self.rate_limiter.acquire(user_id, guild_id)
+        return await asyncio.to_thread(self.rate_limiter.acquire, user_id, guild_id)
+
+    async def transcribe_voice_message(
+        self, interaction: discord.Interaction, message: discord.Message
+    ):
+        note = await self.check_voice_message(interaction, message)
+        if note is None:
+            return
+
+        await self._transcribe_message(interaction, note)
+
+    # callers pass the server's locale when there is one, it says more about what
+    # its members speak than the requester's
+    def languages_for(
+        self, locale: typing.Optional[discord.Locale]
+    ) -> typing.List[str]:
+        hint = str(locale) if locale else None
+        if not self.speech_languages:
+            return [hint or "en-US"]
+
+        # the configured candidates, with the one matching the locale moved to the front
+        matching = [
+            code for code in self.speech_languages if hint and same_language(code, hint)
+        ]
+        return matching[:1] + [
+            code for code in self.speech_languages if code not in matching[:1]
+        ]
+
+    def transcription_key(
+        self, note: VoiceNote, languages: typing.Sequence[str]
+    ) -> tuple:
+        # backends that detect the language give the same transcript for any candidates
+        if not self.speech_backend.uses_language_hint:
+            languages = ()
+        return (note.attachment_id, tuple(languages))
+
+    def start_prefetch(
+        self,
+        note: VoiceNote,
+        languages: typing.Sequence[str],
+        source: str = "prefetch",
+    ) -> typing.Optional[asyncio.Task]:
+        key = self.transcription_key(note, languages)
+        if key in self.transcriptions or self.pool.is_full() or self.draining:
+            return None
+
+        return self.transcriptions.start(
+            key,
+            self._prefetch,
+            note,
+            languages,
+            source,
+            self.transcriptions.notifier(key),
+        )
+
+    async def _prefetch(
+        self,
+        note: VoiceNote,
+        languages: typing.Sequence[str],
+        source: str,
+        on_progress: typing.Callable[[str, int, int], typing.Awaitable[None]],
+    ) -> Recognition:
+        try:
+            with self.pool.reserve():
+                metrics.REQUESTS.labels(source).inc()
+                return await self._run_pipeline(
+                    note, self.admit(note), languages, on_progress
+                )
+        except Exception as e:
+            # a /transcribe that joined this run reports the error to its user
+            log.warning("prefetch failed attachment=%s error=%r", note.attachment_id, e)
+            raise
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if message.guild is None or not self.guild_settings.auto_transcribe_enabled(
+            message.guild.id
+        ):
+            return
+        if not msg_has_voice_note(message):
+            return
+
+        note = VoiceNote.from_message(message)
+        if not self.admit(note).allowed:
+            return
+
+        # the same languages /transcribe will ask for, so it finds the cached transcript
+        languages = self.languages_for(message.guild.preferred_locale)
+        if not self.background.put(message.guild.id, (note, languages)):
+            metrics.REJECTED.labels("background_full").inc()
+
+    async def background_worker(self):
+        while True:
+            guild_id, (note, languages) = await self.background.get()
+            try:
+                # interactive requests come first, background work waits for spare capacity
+                while (
+                    self.pool.pending >= max(1, self.pool.max_queue // 2)
+                    and not self.draining
+                ):
+                    await asyncio.sleep(1)
+
+                # registered like a prefetch, so a /transcribe arriving meanwhile joins it
+                task = self.start_prefetch(note, languages, source="auto")
+                if task is not None:
+                    await asyncio.wait([task])
+            finally:
+                self.background.done(guild_id)
+
+    @app_commands.command(
+        name="autotranscribe",
+        description="Transcribe new voice messages in this server as soon as they're sent",
+    )
+    @app_commands.describe(
+        enabled="Transcribe new voice messages ahead of time, so /transcribe answers instantly"
+    )
+    @app_commands.default_permissions(manage_guild=True)
+    @app_commands.allowed_installs(guilds=True, users=False)
+    @app_commands.allowed_contexts(guilds=True, dms=False, private_channels=False)
+    async def autotranscribe(self, interaction: discord.Interaction, enabled: bool):
+        await self.guild_settings.set_auto_transcribe(interaction.guild_id, enabled)
+        if enabled:
             await interaction.response.send_message(
-                f"Voice message is too long. Maximum duration is {self.max_duration} seconds. This voice message is {int(duration)} seconds.",
+                "New voice messages in this server will be transcribed as soon as they're sent, so /transcribe answers instantly.",
+                ephemeral=True,
+            )
+        else:
+            await interaction.response.send_message(
+                "New voice messages in this server will no longer be transcribed ahead of time.",
                 ephemeral=True,
             )
-            return
 
-        self.selected_messages[interaction.user.id] = message
-        await interaction.response.send_message(
-            f"Voice message selected! Use /transcribe to transcribe it.", ephemeral=True
+    async def run_pipeline(
+        self,
+        note: VoiceNote,
+        admission: Admission,
+        languages: typing.Sequence[str] = (),
+        on_progress: typing.Optional[
+            typing.Callable[[str, int, int], typing.Awaitable[None]]
+        ] = None,
+    ) -> Recognition:
+        # concurrent requests for the same voice message share one download,
+        # decode and recognition, and each gets the progress updates
+        key = self.transcription_key(note, languages)
+        return await self.transcriptions.do(
+            key,
+            self._run_pipeline,
+            note,
+            admission,
+            languages,
+            self.transcriptions.notifier(key),
+            listener=on_progress,
+        )
+
+    async def _run_pipeline(
+        self,
+        note: VoiceNote,
+        admission: Admission,
+        languages: typing.Sequence[str],
+        on_progress: typing.Callable[[str, int, int], typing.Awaitable[None]],
+    ) -> Recognition:
+        return await transcribe_msg(
+            note,
+            self.pool,
+            self.session,
+            self.speech_backend,
+            self.transcript_cache,
+            chunk_seconds=self.chunk_seconds,
+            preprocess_options=self.preprocess_options,
+            max_bytes=self.max_bytes,
+            max_seconds=admission.max_seconds,
+            languages=languages,
+            upstream=self.recognizer,
+            on_progress=on_progress,
         )
 
     async def language_autocomplete(
         self, interaction: discord.Interaction, current: str
     ):
-        language_codes = self.config["language_codes"]
+        # only the code after the last comma is being typed
+        *chosen, current = current.split(",")
+        if not chosen:
+            # answered from a prebuilt index, this runs on every keystroke
+            return self.language_index.search(current.strip())
 
-        popular_languages = [
-            "EN-US",
-            "ES",
-            "FR",
-            "DE",
-            "JA",
-            "ZH",
-            "PT-BR",
-            "RU",
-            "IT",
-            "NL",
-        ]
-
-        if not current:
-            choices = [
-                app_commands.Choice(name=f"{code} - {language_codes[code]}", value=code)
-                for code in popular_languages
-                if code in language_codes
-            ]
-            return choices[:25]
-
-        current_upper = current.upper()
-        current_lower = current.lower()
-
-        exact_matches = []
-        code_matches = []
-        name_matches = []
-
-        for code, name in language_codes.items():
-            if code == current_upper:
-                exact_matches.append((code, name))
-            elif code.startswith(current_upper):
-                code_matches.append((code, name))
-            elif current_lower in name.lower():
-                name_matches.append((code, name))
-
-        all_matches = exact_matches + code_matches + name_matches
-        choices = [
-            app_commands.Choice(name=f"{code} - {name}", value=code)
-            for code, name in all_matches
+        chosen = [code.strip().upper() for code in chosen if code.strip()]
+        prefix = ",".join(chosen) + ","
+        return [
+            app_commands.Choice(
+                name=f"{prefix}{choice.name}", value=f"{prefix}{choice.value}"
+            )
+            for choice in self.language_index.search(current.strip())
+            if choice.value not in chosen
         ]
 
-        return choices[:25]
-
     @app_commands.command(
         name="transcribe", description="Transcribe the selected voice message"
     )
     @app_commands.describe(
-        translate_to="Language code to translate to (e.g., EN-US, ES, FR)",
+        translate_to="Language codes to translate to, comma separated (e.g., ES or ES,FR,DE)",
         public="Should everyone see this response? (default: false)",
     )
     @app_commands.autocomplete(translate_to=language_autocomplete)
@@ -133,152 +500,567 @@ class Transcriber(commands.Cog):
         translate_to: str = None,
         public: bool = False,
     ):
-        if interaction.user.id not in self.selected_messages:
+        note = await self.selected_messages.get(interaction.user.id)
+        if note is None:
             await interaction.response.send_message(
                 "No voice message selected! Right-click a message and select 'Select Voice Message' first.",
                 ephemeral=True,
             )
             return
 
-        message = self.selected_messages[interaction.user.id]
-        await self._transcribe_message(interaction, message, translate_to, public)
+        if note.url_expired():
+            note = await self.refetch_voice_note(note)
+            if note is None:
+                await interaction.response.send_message(
+                    "The selected voice message is no longer available. Please select it again.",
+                    ephemeral=True,
+                )
+                return
+            await self.selected_messages.set(interaction.user.id, note)
+
+        await self._transcribe_message(interaction, note, translate_to, public)
+
+    async def refetch_voice_note(self, note: VoiceNote) -> typing.Optional[VoiceNote]:
+        # attachment links expire, the message itself has to be fetched again for a fresh one
+        channel = self.bot.get_partial_messageable(note.channel_id)
+        try:
+            message = await channel.fetch_message(note.message_id)
+        except discord.HTTPException:
+            return None
+
+        if not msg_has_voice_note(message):
+            return None
+        return VoiceNote.from_message(message)
 
     async def _transcribe_message(
         self,
         interaction: discord.Interaction,
-        message: discord.Message,
+        note: VoiceNote,
         translate_to: str = None,
         public: bool = False,
     ):
-        await interaction.response.defer(ephemeral=not public)
+        # every path goes through the same checks, before deferring or downloading anything
+        admission = self.admit(note)
+        if not admission.allowed:
+            metrics.REJECTED.labels("admission").inc()
+            await interaction.response.send_message(admission.reason, ephemeral=True)
+            return
+
+        # capacity is checked first, a user told to come back later keeps their token
+        if self.draining and self.journal is None:
+            await interaction.response.send_message(
+                "vmt is restarting, please try again in a minute.", ephemeral=True
+            )
+            return
+
+        if self.pool.is_full():
+            metrics.REJECTED.labels("busy").inc()
+            await interaction.response.send_message(
+                "vmt is busy transcribing other voice messages right now, please try again in a few seconds.",
+                ephemeral=True,
+            )
+            return
 
-        if translate_to is not None:
-            translate_to = translate_to.upper()
-            language_codes = self.config["language_codes"]
-            if translate_to not in language_codes:
-                valid_codes = ", ".join([f"`{code}`" for code in language_codes])
-                await interaction.followup.send(
-                    f"**Invalid language code.**\n> Valid language codes: {valid_codes}",
+        with self.pool.reserve():
+            retry_after = 0.0
+            if self.prefetched.pop(interaction.user.id) != note.attachment_id:
+                retry_after = await self.acquire_rate_limit(
+                    interaction.user.id, interaction.guild_id
+                )
+            if retry_after:
+                metrics.REJECTED.labels("rate_limited").inc()
+                await interaction.response.send_message(
+                    f"You're transcribing too quickly! Please try again in {math.ceil(retry_after)} seconds.",
                     ephemeral=True,
                 )
                 return
 
-        if not msg_has_voice_note(message):
+            metrics.REQUESTS.labels("interaction").inc()
+            await self._run_transcription(
+                interaction, note, admission, translate_to, public
+            )
+
+    async def _run_transcription(
+        self,
+        interaction: discord.Interaction,
+        note: VoiceNote,
+        admission: Admission,
+        translate_to: str = None,
+        public: bool = False,
+    ):
+        await interaction.response.defer(ephemeral=not public)
+
+        target_langs = parse_language_list(translate_to)
+        language_codes = self.config["language_codes"]
+        invalid_codes = [code for code in target_langs if code not in language_codes]
+        if invalid_codes:
+            valid_codes = ", ".join([f"`{code}`" for code in language_codes])
             await interaction.followup.send(
-                "This message does not contain a voice message.", ephemeral=True
+                f"**Invalid language code: {', '.join(invalid_codes)}.**\n> Valid language codes: {valid_codes}",
+                ephemeral=True,
+            )
+            return
+        if len(target_langs) > self.max_translations:
+            await interaction.followup.send(
+                f"You can translate into at most {self.max_translations} languages at once.",
+                ephemeral=True,
             )
             return
 
-        author = message.author
+        job = Job.from_interaction(
+            interaction,
+            note,
+            translate_to,
+            public,
+            languages=self.languages_for(
+                interaction.guild_locale or interaction.locale
+            ),
+        )
+        if self.journal is not None:
+            await self.journal.add(job)
+            if self.draining:
+                # shutting down, the next process answers this from the journal
+                return
 
-        try:
-            transcribed_text = await transcribe_msg(message)
-
-            translated_text = None
-            if translate_to is not None and transcribed_text:
-                try:
-                    if self.deepl_server_url:
-                        deepl_translator = deepl.Translator(
-                            auth_key=self.deepl_api_key,
-                            server_url=self.deepl_server_url,
-                        )
-                    else:
-                        deepl_translator = deepl.Translator(auth_key=self.deepl_api_key)
-
-                    result = deepl_translator.translate_text(
-                        transcribed_text, target_lang=translate_to
+        await self.run_job(job, interaction.followup, admission)
+
+    async def run_job(
+        self,
+        job: Job,
+        followup: discord.Webhook,
+        admission: typing.Optional[Admission] = None,
+    ):
+        note = job.note
+        if admission is None:
+            admission = self.admit(note)
+        target_langs = parse_language_list(job.translate_to)
+        author = note.author_name
+        progress_message = None
+        last_progress_edit = 0.0
+
+        if job.message_id is not None:
+            try:
+                progress_message = await followup.fetch_message(job.message_id)
+            except discord.HTTPException:
+                pass
+
+        async def on_progress(partial_text, done, total):
+            nonlocal progress_message, last_progress_edit
+            # message edits are rate limited, so update at most once a second
+            if not partial_text or time.monotonic() - last_progress_edit < 1:
+                return
+            last_progress_edit = time.monotonic()
+
+            embed = make_embed(
+                partial_text,
+                author,
+                job.user_name,
+                progress=f"Transcribing... ({done}/{total} parts done)",
+            )
+            if progress_message is None:
+                progress_message = await followup.send(
+                    embed=embed, ephemeral=not job.public, wait=True
+                )
+                if self.journal is not None:
+                    await self.journal.set_message(
+                        job.interaction_id, progress_message.id
                     )
-                    translated_text = (
-                        result.text if hasattr(result, "text") else str(result)
+            else:
+                await progress_message.edit(embed=embed)
+
+        self.jobs[job.interaction_id] = asyncio.current_task()
+        try:
+            recognition = await self.run_pipeline(
+                note, admission, job.languages, on_progress
+            )
+            transcribed_text = recognition.text
+
+            # one transcript, every requested language translated concurrently
+            translations = {}
+            if target_langs and transcribed_text:
+                with metrics.stage("translate"):
+                    translations = await self.translator.translate_many(
+                        transcribed_text, target_langs, recognition.language
                     )
-                except Exception as translation_error:
-                    print(f"Translation error: {translation_error}")
-                    translated_text = None
 
             embed = make_embed(
                 transcribed_text,
                 author,
-                interaction.user,
-                translate_to,
-                translated_text,
+                job.user_name,
+                translations,
+                truncated_to=admission.max_seconds if admission.truncated else None,
+                untranslated=[
+                    lang for lang in target_langs if lang not in translations
+                ],
             )
 
-            await interaction.followup.send(embed=embed, ephemeral=not public)
+            with metrics.stage("send"):
+                if progress_message is not None:
+                    await progress_message.edit(embed=embed)
+                else:
+                    await followup.send(embed=embed, ephemeral=not job.public)
 
         except sr.UnknownValueError as e:
-            await interaction.followup.send(
+            await self._discard_progress(progress_message)
+            await followup.send(
                 f"Could not transcribe the Voice Message from {author} as the response was empty.",
                 ephemeral=True,
             )
+        except CircuitOpenError:
+            # failing fast while the recognizer is down, no need for a traceback per request
+            await self._discard_progress(progress_message)
+            await followup.send(
+                "Speech recognition is unavailable right now, please try again in a few minutes.",
+                ephemeral=True,
+            )
+        except AttachmentTooLarge:
+            # the metadata undersold the size, the capped download caught it
+            await self._discard_progress(progress_message)
+            await followup.send(
+                f"Voice message is too large. Maximum size is {self.max_bytes / (1024 * 1024):g} MB.",
+                ephemeral=True,
+            )
         except Exception as e:
-            await interaction.followup.send(
+            await self._discard_progress(progress_message)
+            await followup.send(
                 f"Could not transcribe the Voice Message from {author} due to an error.",
                 ephemeral=True,
             )
-            print(e)
+            log.exception("transcription failed attachment=%s", note.attachment_id)
+        finally:
+            self.jobs.pop(job.interaction_id, None)
+
+        # only reached when the job was answered, a cancelled one stays journaled
+        if self.journal is not None:
+            await self.journal.remove(job.interaction_id)
+
+    async def drain(self):
+        # stop starting new work and give in-flight jobs a chance to finish
+        self.draining = True
+        tasks = list(self.jobs.values())
+        if not tasks:
+            return
+
+        log.info("draining jobs count=%s timeout=%s", len(tasks), self.drain_seconds)
+        done, pending = await asyncio.wait(tasks, timeout=self.drain_seconds)
+        for task in pending:
+            task.cancel()
+        log.info("drained jobs finished=%s left=%s", len(done), len(pending))
+
+    async def resume_jobs(self):
+        jobs = await self.journal.pending()
+        if not jobs:
+            return
+
+        log.info("resuming journaled jobs count=%s", len(jobs))
+        await asyncio.gather(*(self._resume_job(job) for job in jobs))
+
+    async def _resume_job(self, job: Job):
+        # the token would run out before a transcript could be sent
+        if job.expired():
+            log.info("dropping expired job interaction=%s", job.interaction_id)
+            await self.journal.remove(job.interaction_id)
+            return
+
+        # the interaction token keeps working across restarts. built the way
+        # Interaction.followup is, an application webhook, so ephemeral sends work
+        followup = discord.Webhook.from_state(
+            data={"id": job.application_id, "type": 3, "token": job.token},
+            state=self.bot._connection,
+        )
+        try:
+            if job.note.url_expired():
+                note = await self.refetch_voice_note(job.note)
+                if note is None:
+                    await followup.send(
+                        "The selected voice message is no longer available. Please select it again.",
+                        ephemeral=True,
+                    )
+                    await self.journal.remove(job.interaction_id)
+                    return
+                job = job._replace(note=note)
+
+            try:
+                with self.pool.reserve():
+                    metrics.REQUESTS.labels("resumed").inc()
+                    await self.run_job(job, followup)
+            except PoolBusyError:
+                await self.journal.remove(job.interaction_id)
+                await followup.send(
+                    "vmt is busy transcribing other voice messages right now, please try again in a few seconds.",
+                    ephemeral=True,
+                )
+        except discord.HTTPException as e:
+            # most likely the token ran out while the bot was down
+            log.warning(
+                "could not resume job interaction=%s error=%r", job.interaction_id, e
+            )
+            await self.journal.remove(job.interaction_id)
+        except Exception:
+            # one broken job mustn't stop the rest from being resumed, or come back next start
+            log.exception("resuming job failed interaction=%s", job.interaction_id)
+            await self.journal.remove(job.interaction_id)
+
+    async def _discard_progress(self, progress_message):
+        if progress_message is None:
+            return
+        try:
+            await progress_message.delete()
+        except discord.HTTPException:
+            pass
 
 
 def make_embed(
-    transcribed_text, author, ctx_author=None, translate_to=None, translated_text=None
+    transcribed_text,
+    author_name,
+    requested_by=None,
+    translations=None,
+    progress=None,
+    truncated_to=None,
+    untranslated=None,
 ):
+    title = f"{author_name}'s Voice Message"
     embed = discord.Embed(
         color=0xACD8AA,
-        title=f"{author.name}'s Voice Message",
+        title=title,
+    )
+
+    footer = None
+    if progress:
+        footer = progress
+    elif requested_by:
+        footer = f"Requested by {requested_by}"
+        if truncated_to:
+            footer += f" • Only the first {int(truncated_to)} seconds were transcribed"
+        if untranslated:
+            footer += f" • Couldn't translate into {', '.join(untranslated)} right now"
+
+    fields = []
+    for language, translated_text in (translations or {}).items():
+        if translated_text:
+            fields.append(
+                (f"Translation (Into {language.upper()})", str(translated_text))
+            )
+    # discord allows 25 fields
+    fields = fields[:25]
+
+    # share what's left of discord's 6000 character embed limit, keeping room for the
+    # note that something was cut
+    budget = (
+        6000
+        - len(title)
+        - len(footer or "")
+        - len(TRUNCATED_NOTE)
+        - 3
+        - sum(len(name) for name, _ in fields)
     )
-    embed.add_field(
-        name=f"Transcription",
-        value=transcribed_text,
-        inline=False,
+    # the transcript goes in the description, which holds 4096 characters to a field's 1024
+    description_limit = min(
+        4096,
+        max(
+            budget // (len(fields) + 1),
+            budget - sum(min(1024, len(value)) for _, value in fields),
+        ),
     )
+    description = truncate_field(transcribed_text, description_limit)
+    embed.description = description
+    cut = description != transcribed_text
 
-    if translate_to and translated_text:
-        embed.add_field(
-            name=f"Translation (Into {translate_to.upper()})",
-            value=str(translated_text),
-            inline=False,
-        )
+    if fields:
+        field_limit = min(1024, (budget - len(description)) // len(fields))
+        for name, value in fields:
+            shown = truncate_field(value, field_limit)
+            cut = cut or shown != value
+            embed.add_field(name=name, value=shown, inline=False)
 
-    if ctx_author:
-        embed.set_footer(text=f"Requested by {ctx_author.name}")
+    if cut:
+        footer = f"{footer} • {TRUNCATED_NOTE}" if footer else TRUNCATED_NOTE
+    if footer:
+        embed.set_footer(text=footer)
 
     return embed
 
 
+# long voice messages can produce more text than an embed allows
+def truncate_field(text, limit=1024):
+    if len(text) <= limit:
+        return text
+    return text[: limit - 1] + "…"
+
+
+def parse_language_list(value: typing.Optional[str]) -> typing.List[str]:
+    # "es, fr,DE" -> ["ES", "FR", "DE"], duplicates dropped
+    if not value:
+        return []
+    codes = [code.strip().upper() for code in value.split(",")]
+    return list(dict.fromkeys(code for code in codes if code))
+
+
 def msg_has_voice_note(msg: typing.Optional[discord.Message]) -> bool:
     if not msg:
         return False
-    if not msg.attachments or not msg.flags.value >> 13:
+    # bit 13 is IS_VOICE_MESSAGE
+    if not msg.attachments or not (msg.flags.value & (1 << 13)):
         return False
     return True
 
 
 async def transcribe_msg(
-    msg: typing.Optional[discord.Message],
-) -> typing.Optional[typing.Union[typing.Any, list, tuple]]:
-    if not msg or not msg_has_voice_note(msg):
+    note: typing.Optional[VoiceNote],
+    pool: AudioWorkerPool,
+    session: aiohttp.ClientSession,
+    backend: SpeechBackend,
+    cache: typing.Optional[TranscriptCache] = None,
+    chunk_seconds: float = 15,
+    preprocess_options: PreprocessOptions = PreprocessOptions(),
+    max_bytes: typing.Optional[int] = None,
+    max_seconds: typing.Optional[float] = None,
+    languages: typing.Sequence[str] = (),
+    upstream: typing.Optional[Upstream] = None,
+    on_progress: typing.Optional[
+        typing.Callable[[str, int, int], typing.Awaitable[None]]
+    ] = None,
+) -> typing.Optional[Recognition]:
+    if not note:
         return None
 
-    voice_msg_bytes = await msg.attachments[0].read()
-    voice_msg = io.BytesIO(voice_msg_bytes)
+    # backends that detect the language themselves give the same result for any hint
+    if not backend.uses_language_hint:
+        languages = ()
+    note_key = language_key(attachment_key(note.attachment_id), languages)
 
-    audio_segment = pydub.AudioSegment.from_file(voice_msg)
-    wav_bytes = io.BytesIO()
-    audio_segment.export(wav_bytes, format="wav")
+    # repeat requests for the same attachment skip download, decode and recognition
+    if cache is not None:
+        recognition = metrics.cache_lookup("transcript", await cache.get(note_key))
+        if recognition is not None:
+            return recognition
 
-    recognizer = sr.Recognizer()
-    with sr.AudioFile(wav_bytes) as source:
-        audio_data = recognizer.record(source)
+    # cached transcripts are still served while the recognizer is down, nothing else is
+    if upstream is not None and not upstream.available():
+        raise CircuitOpenError(f"{upstream.name} is unavailable")
 
-    try:
-        transcribed_text = recognizer.recognize_google(audio_data)
+    # the attachment is streamed into ffmpeg and hashed on the way through
+    with metrics.stage("decode"):
+        pcm, digest_key = await pool.decode(
+            decode_attachment, session, note.url, max_bytes, max_seconds
+        )
+    metrics.AUDIO_SECONDS.inc(len(pcm) / (SAMPLE_RATE * SAMPLE_WIDTH))
+
+    # the same file re-uploaded under a new attachment still skips recognition
+    if digest_key is not None:
+        digest_key = language_key(digest_key, languages)
+    if cache is not None and digest_key is not None:
+        recognition = metrics.cache_lookup("transcript", await cache.get(digest_key))
+        if recognition is not None:
+            await cache.set(note_key, recognition)
+            return recognition
+
+    # trim silence and normalize so less audio goes to the recognizer
+    with metrics.stage("preprocess"):
+        pcm, saved = await asyncio.to_thread(preprocess, pcm, preprocess_options)
+    metrics.PREPROCESS_SAVED_SECONDS.inc(saved.seconds_saved)
+    metrics.PREPROCESS_SAVED_BYTES.inc(saved.bytes_saved)
+
+    # long voice messages are split at pauses and the pieces recognized concurrently
+    with metrics.stage("split"):
+        chunks = await asyncio.to_thread(split_on_silence, pcm, chunk_seconds)
+    with metrics.stage("recognize"):
+        recognition = await recognize_chunks(
+            pool, backend, chunks, languages, upstream, on_progress
+        )
 
-    except sr.UnknownValueError as e:
-        raise e
+    if cache is not None:
+        if digest_key is not None:
+            await cache.set(digest_key, recognition)
+        await cache.set(note_key, recognition)
 
-    except Exception as e:
-        raise e
+    return recognition
 
-    return transcribed_text
+
+async def recognize_chunks(
+    pool: AudioWorkerPool,
+    backend: SpeechBackend,
+    chunks: typing.List[bytes],
+    languages: typing.Sequence[str] = (),
+    upstream: typing.Optional[Upstream] = None,
+    on_progress: typing.Optional[
+        typing.Callable[[str, int, int], typing.Awaitable[None]]
+    ] = None,
+) -> Recognition:
+    results = [None] * len(chunks)
+    detected = [None] * len(chunks)
+
+    async def recognize(index, chunk, languages):
+        reserved = False
+
+        async def attempt():
+            nonlocal reserved
+            # the first attempt runs on the thread reserved below, a hedge only
+            # starts while another one is idle
+            if reserved:
+                reserved = False
+            else:
+                await pool.reserve_recognizer()
+            return await pool.recognize(backend.recognize, chunk, languages)
+
+        try:
+            # waiting for a free thread is local queueing, not upstream latency, so
+            # the deadline only starts once one is reserved
+            await pool.reserve_recognizer()
+            reserved = True
+            recognition = await (
+                upstream.call(attempt, spare=pool.recognizer_idle)
+                if upstream
+                else attempt()
+            )
+            results[index], detected[index] = recognition
+        except sr.UnknownValueError:
+            # a silent piece shouldn't fail the whole voice message
+            results[index] = ""
+        finally:
+            # the call never got to use it, e.g. the circuit breaker was open
+            if reserved:
+                pool.release_recognizer()
+
+    # with several candidates the first piece settles the language for the rest,
+    # instead of every piece trying every candidate
+    first = 0
+    if len(languages) > 1 and len(chunks) > 1:
+        await recognize(0, chunks[0], languages)
+        if detected[0]:
+            languages = [detected[0]]
+        first = 1
+
+    tasks = [
+        asyncio.create_task(recognize(index, chunks[index], languages))
+        for index in range(first, len(chunks))
+    ]
+    reported = 0
+    try:
+        for finished in asyncio.as_completed(tasks):
+            await finished
+
+            # only report the leading parts that are done, so text appears in order
+            done = reported
+            while done < len(results) and results[done] is not None:
+                done += 1
+            if on_progress is not None and reported < done < len(results):
+                reported = done
+                await on_progress(
+                    " ".join(text for text in results[:done] if text),
+                    done,
+                    len(results),
+                )
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    transcribed_text = " ".join(text for text in results if text)
+    if not transcribed_text:
+        raise sr.UnknownValueError()
+    return Recognition(
+        transcribed_text, next((code for code in detected if code), None)
+    )
 
 
 async def setup(bot):
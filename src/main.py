@@ -1,13 +1,34 @@
 import discord
 from discord.ext import commands
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
 import os
+import signal
 from dotenv import load_dotenv
 
+from utils.metrics import start_metrics_server
+from utils.recognizers import load_backend
+
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 DEEPL_API_KEY = os.getenv("DEEPL_API_KEY")
 MAX_VOICE_MESSAGE_DURATION = int(os.getenv("MAX_VOICE_MESSAGE_DURATION", "60"))
+METRICS_PORT = int(os.getenv("METRICS_PORT") or "0")
+METRICS_ADDR = os.getenv("METRICS_ADDR", "127.0.0.1")
+# "auto" lets discord pick the shard count, cluster.py sets SHARD_IDS per process
+SHARD_COUNT = os.getenv("SHARD_COUNT") or "1"
+SHARD_IDS = os.getenv("SHARD_IDS")
+CLUSTER_ID = int(os.getenv("CLUSTER_ID", "0"))
+# fingerprint of the last synced command tree, so unchanged commands skip the sync
+COMMAND_SYNC_STATE = os.getenv(
+    "COMMAND_SYNC_STATE", os.path.join("data", "command_sync.json")
+)
+
+log = logging.getLogger("vmt")
 
 if not BOT_TOKEN:
     raise ValueError(
@@ -19,16 +40,49 @@ if not DEEPL_API_KEY:
     )
 
 
-class Bot(commands.Bot):
-    def __init__(self):
+class Bot(commands.AutoShardedBot):
+    def __init__(self, force_sync: bool = False):
         # intents for the bot
         intents = discord.Intents.default()
         intents.message_content = True
         intents.messages = True
         intents.guilds = True
-        super().__init__(command_prefix=commands.when_mentioned, intents=intents)
+        super().__init__(
+            command_prefix=commands.when_mentioned,
+            intents=intents,
+            shard_count=None if SHARD_COUNT == "auto" else int(SHARD_COUNT),
+            shard_ids=(
+                [int(shard_id) for shard_id in SHARD_IDS.split(",")]
+                if SHARD_IDS
+                else None
+            ),
+        )
+        self.speech_backend = None
+        # command name -> id, read by cogs to render command mentions without a rest call
+        self.command_ids = {}
+        self.force_sync = force_sync
+        self.sync_watch = None
 
     async def setup_hook(self) -> None:
+        # deploys stop the worker with SIGTERM, close cleanly so in-flight jobs can drain
+        try:
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGTERM, self.on_sigterm
+            )
+        except NotImplementedError:
+            # not available on windows
+            pass
+
+        if METRICS_PORT:
+            start_metrics_server(METRICS_PORT, METRICS_ADDR)
+            log.info(
+                "metrics server started addr=%s port=%s", METRICS_ADDR, METRICS_PORT
+            )
+
+        # offline models take a while to load, so do it once before any cog needs them
+        self.speech_backend = await asyncio.to_thread(load_backend)
+        log.info("speech backend loaded backend=%s", self.speech_backend.name)
+
         cogsLoaded = 0
         cogsCount = 0
         cogs_path = os.path.join(os.path.dirname(__file__), "cogs")
@@ -36,20 +90,119 @@ class Bot(commands.Bot):
             if cog_file.endswith(".py"):
                 cogsCount += 1
                 try:
-                    print(f"Loading cog {cog_file}...")
+                    log.info("loading cog file=%s", cog_file)
                     await self.load_extension(f"cogs.{cog_file[:-3]}")
                     cogsLoaded += 1
-                except Exception as e:
-                    print(f"Failed to load cog {cog_file}: {e}")
-        print(f"Loaded {cogsLoaded}/{cogsCount} cogs.")
+                except Exception:
+                    log.exception("failed to load cog file=%s", cog_file)
+        log.info("cogs loaded loaded=%s total=%s", cogsLoaded, cogsCount)
+
+        # syncing is a rate limited global call, skip it when nothing changed
+        fingerprint = self.command_fingerprint()
+        state = load_sync_state()
+        if not self.force_sync and state.get("fingerprint") == fingerprint:
+            self.command_ids = state["command_ids"]
+            log.info(
+                "slash commands unchanged, sync skipped count=%s", len(self.command_ids)
+            )
+        # commands are global, so only the first cluster has to sync them
+        elif CLUSTER_ID == 0:
+            await self.sync_commands()
+            save_sync_state(fingerprint, self.command_ids)
+            log.info("slash commands synced count=%s", len(self.command_ids))
+        else:
+            # the ids from before the first cluster's sync, replaced once it's done
+            await self.fetch_command_ids()
+            self.sync_watch = asyncio.create_task(self.wait_for_sync(fingerprint))
+
+    def on_sigterm(self):
+        log.info("received SIGTERM, shutting down")
+        self.shutdown_task = asyncio.create_task(self.close())
+
+    async def close(self):
+        # the gateway and http session are still up while transcriptions finish
+        if self.sync_watch is not None:
+            self.sync_watch.cancel()
+        transcriber = self.get_cog("Transcriber")
+        if transcriber is not None:
+            await transcriber.drain()
+        await super().close()
+
+    def command_fingerprint(self) -> str:
+        # the payload tree.sync() would send, in a stable order, for this application
+        payload = sorted(
+            (command.to_dict(self.tree) for command in self.tree.get_commands()),
+            key=lambda command: (command["type"], command["name"]),
+        )
+        return hashlib.sha256(
+            json.dumps([self.application_id, payload], sort_keys=True).encode()
+        ).hexdigest()
 
-        await self.tree.sync()
-        print("Slash commands synced!")
+    async def sync_commands(self):
+        synced = await self.tree.sync()
+        self.command_ids = {command.name: command.id for command in synced}
+
+    async def fetch_command_ids(self):
+        commands = await self.tree.fetch_commands()
+        self.command_ids = {command.name: command.id for command in commands}
+
+    async def wait_for_sync(self, fingerprint: str, attempts: int = 60):
+        # the first cluster writes the sync state once tree.sync() returns
+        for _ in range(attempts):
+            await asyncio.sleep(5)
+            state = load_sync_state()
+            if state.get("fingerprint") == fingerprint:
+                self.command_ids = state["command_ids"]
+                log.info(
+                    "slash command ids loaded after sync count=%s",
+                    len(self.command_ids),
+                )
+                return
+
+        # no sync showed up, what discord has now is the best there is
+        log.warning("slash command sync state never updated, fetching command ids")
+        await self.fetch_command_ids()
 
     async def on_ready(self):
-        print(f"Logged in as {self.user} (ID: {self.user.id})")
-        print("vmt is ready to transcribe and translate voice messages!")
+        log.info(
+            "logged in user=%s id=%s cluster=%s shards=%s",
+            self.user,
+            self.user.id,
+            CLUSTER_ID,
+            sorted(self.shards),
+        )
+        log.info("vmt is ready to transcribe and translate voice messages!")
+
+
+def load_sync_state() -> dict:
+    try:
+        with open(COMMAND_SYNC_STATE) as state_file:
+            return json.load(state_file)
+    except (OSError, ValueError):
+        return {}
 
 
-bot = Bot()
-bot.run(BOT_TOKEN)
+def save_sync_state(fingerprint: str, command_ids: dict):
+    directory = os.path.dirname(COMMAND_SYNC_STATE)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # written to a temporary file first so a crash never leaves half a state file
+    temp_path = f"{COMMAND_SYNC_STATE}.tmp"
+    with open(temp_path, "w") as state_file:
+        json.dump({"fingerprint": fingerprint, "command_ids": command_ids}, state_file)
+    os.replace(temp_path, COMMAND_SYNC_STATE)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the vmt discord bot.")
+    parser.add_argument(
+        "--force-sync",
+        action="store_true",
+        help="sync slash commands even if they look unchanged since the last sync",
+    )
+    args = parser.parse_args()
+
+    # the root logger so every module's logs share discord.py's format
+    discord.utils.setup_logging(root=True)
+    bot = Bot(force_sync=args.force_sync)
+    bot.run(BOT_TOKEN, log_handler=None)
@@ -0,0 +1,274 @@
+import asyncio
+import contextlib
+import hashlib
+import io
+import typing
+
+import aiohttp
+import pydub
+import pydub.effects
+import pydub.silence
+
+try:
+    import av
+except ImportError:
+    # optional, without it every attachment is decoded by an ffmpeg process
+    av = None
+
+# what the recognizer actually needs: 16 khz mono 16-bit pcm
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+BYTES_PER_MS = SAMPLE_RATE * SAMPLE_WIDTH // 1000
+CHUNK_SIZE = 64 * 1024
+# the first ogg page holds the OpusHead packet, well within this many bytes
+OGG_PROBE_SIZE = 64
+
+
+class AudioDecodeError(Exception):
+    pass
+
+
+class AttachmentTooLarge(AudioDecodeError):
+    pass
+
+
+class PreprocessOptions(typing.NamedTuple):
+    trim_silence: bool = True
+    normalize: bool = True
+    silence_threshold: float = -45.0
+    padding_ms: int = 150
+
+
+class PreprocessStats(typing.NamedTuple):
+    seconds_saved: float
+    bytes_saved: int
+
+
+async def iter_attachment(
+    session: aiohttp.ClientSession,
+    url: str,
+    digest=None,
+    max_bytes: typing.Optional[int] = None,
+) -> typing.AsyncIterator[bytes]:
+    async with session.get(url) as response:
+        response.raise_for_status()
+        if max_bytes and (response.content_length or 0) > max_bytes:
+            raise AttachmentTooLarge(f"{response.content_length} bytes")
+
+        # the size in the attachment metadata isn't trusted, the stream is capped too
+        received = 0
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            received += len(chunk)
+            if max_bytes and received > max_bytes:
+                raise AttachmentTooLarge(f"more than {max_bytes} bytes")
+            if digest is not None:
+                digest.update(chunk)
+            yield chunk
+
+
+async def decode_stream(
+    chunks: typing.AsyncIterator[bytes], max_seconds: typing.Optional[float] = None
+) -> bytes:
+    # a single ffmpeg process reads the attachment from stdin and writes raw pcm to stdout
+    limit = ["-t", str(max_seconds)] if max_seconds else []
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-i",
+        "pipe:0",
+        *limit,
+        "-f",
+        "s16le",
+        "-acodec",
+        "pcm_s16le",
+        "-ac",
+        "1",
+        "-ar",
+        str(SAMPLE_RATE),
+        "pipe:1",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+    async def feed():
+        try:
+            async with contextlib.aclosing(chunks):
+                async for chunk in chunks:
+                    process.stdin.write(chunk)
+                    await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg stopped reading, either it hit max_seconds or its exit code explains why
+            pass
+        finally:
+            process.stdin.close()
+
+    try:
+        pcm, stderr, _ = await asyncio.gather(
+            process.stdout.read(), process.stderr.read(), feed()
+        )
+        await process.wait()
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+    if process.returncode != 0:
+        raise AudioDecodeError(stderr.decode(errors="replace").strip())
+
+    return pcm
+
+
+def is_ogg_opus(head: bytes) -> bool:
+    return head.startswith(b"OggS") and b"OpusHead" in head[:OGG_PROBE_SIZE]
+
+
+def decode_opus(data: bytes, max_seconds: typing.Optional[float] = None) -> bytes:
+    # decodes in this process with pyav, no ffmpeg process to start
+    limit = int(max_seconds * SAMPLE_RATE) * SAMPLE_WIDTH if max_seconds else None
+    pcm = bytearray()
+    try:
+        with av.open(io.BytesIO(data), format="ogg") as container:
+            resampler = av.AudioResampler(format="s16", layout="mono", rate=SAMPLE_RATE)
+            for frame in container.decode(audio=0):
+                for resampled in resampler.resample(frame):
+                    # planes can be padded past the last sample
+                    pcm += bytes(resampled.planes[0])[
+                        : resampled.samples * SAMPLE_WIDTH
+                    ]
+                if limit and len(pcm) >= limit:
+                    break
+            else:
+                for resampled in resampler.resample(None):
+                    pcm += bytes(resampled.planes[0])[
+                        : resampled.samples * SAMPLE_WIDTH
+                    ]
+    except (av.error.FFmpegError, IndexError) as e:
+        raise AudioDecodeError(str(e)) from e
+
+    return bytes(pcm[:limit] if limit else pcm)
+
+
+async def prepend(head: bytes, chunks: typing.AsyncIterator[bytes]):
+    if head:
+        yield head
+    async for chunk in chunks:
+        yield chunk
+
+
+async def decode_attachment(
+    session: aiohttp.ClientSession,
+    url: str,
+    max_bytes: typing.Optional[int] = None,
+    max_seconds: typing.Optional[float] = None,
+) -> typing.Tuple[bytes, typing.Optional[str]]:
+    digest = hashlib.sha256()
+    complete = False
+
+    async def chunks():
+        nonlocal complete
+        stream = iter_attachment(session, url, digest, max_bytes)
+        async with contextlib.aclosing(stream):
+            async for chunk in stream:
+                yield chunk
+        complete = True
+
+    stream = chunks()
+    async with contextlib.aclosing(stream):
+        head = b""
+        if av is not None:
+            async for chunk in stream:
+                head += chunk
+                if len(head) >= OGG_PROBE_SIZE:
+                    break
+
+        if av is not None and is_ogg_opus(head):
+            # voice messages are always ogg/opus, the whole file is small enough to buffer
+            data = bytearray(head)
+            async for chunk in stream:
+                data += chunk
+            try:
+                pcm = await asyncio.to_thread(decode_opus, bytes(data), max_seconds)
+            except AudioDecodeError:
+                # ffmpeg is more forgiving of damaged files, give it a go before failing
+                pcm = await decode_stream(prepend(bytes(data), stream), max_seconds)
+        else:
+            pcm = await decode_stream(prepend(head, stream), max_seconds)
+
+    # a download cut short by max_seconds only hashed part of the file
+    return pcm, (f"sha256:{digest.hexdigest()}" if complete else None)
+
+
+def split_on_silence(
+    pcm: bytes, chunk_seconds: float = 15, min_silence_ms: int = 400
+) -> typing.List[bytes]:
+    segment = pydub.AudioSegment(
+        data=pcm, sample_width=SAMPLE_WIDTH, frame_rate=SAMPLE_RATE, channels=1
+    )
+    max_ms = int(chunk_seconds * 1000)
+    if len(segment) <= max_ms:
+        return [pcm]
+
+    nonsilent = pydub.silence.detect_nonsilent(
+        segment,
+        min_silence_len=min_silence_ms,
+        silence_thresh=segment.dBFS - 16,
+        seek_step=10,
+    )
+
+    # cut in the middle of each pause so no words are clipped
+    cuts = [
+        (end + next_start) // 2
+        for (_, end), (next_start, _) in zip(nonsilent, nonsilent[1:])
+    ]
+
+    boundaries = [0]
+    last_cut = 0
+    for cut in cuts + [len(segment)]:
+        if cut - boundaries[-1] > max_ms and last_cut > boundaries[-1]:
+            boundaries.append(last_cut)
+        # nobody stopped talking, fall back to fixed size pieces
+        while cut - boundaries[-1] > max_ms * 2:
+            boundaries.append(boundaries[-1] + max_ms)
+        last_cut = cut
+
+    offsets = [boundary * BYTES_PER_MS for boundary in boundaries] + [len(pcm)]
+    return [pcm[start:end] for start, end in zip(offsets, offsets[1:]) if end > start]
+
+
+def preprocess(
+    pcm: bytes, options: PreprocessOptions = PreprocessOptions()
+) -> typing.Tuple[bytes, PreprocessStats]:
+    # ffmpeg has already downmixed to mono and resampled to SAMPLE_RATE
+    segment = pydub.AudioSegment(
+        data=pcm, sample_width=SAMPLE_WIDTH, frame_rate=SAMPLE_RATE, channels=1
+    )
+    original_ms = len(segment)
+
+    if options.trim_silence:
+        start = pydub.silence.detect_leading_silence(
+            segment, silence_threshold=options.silence_threshold, chunk_size=10
+        )
+        end = len(segment) - pydub.silence.detect_leading_silence(
+            segment.reverse(),
+            silence_threshold=options.silence_threshold,
+            chunk_size=10,
+        )
+        # an all-silent message is left alone, the recognizer reports it as empty
+        if end > start:
+            segment = segment[
+                max(0, start - options.padding_ms) : min(
+                    original_ms, end + options.padding_ms
+                )
+            ]
+
+    if options.normalize and segment.max_dBFS != float("-inf"):
+        segment = pydub.effects.normalize(segment, headroom=1.0)
+
+    processed = segment.raw_data
+    return processed, PreprocessStats(
+        seconds_saved=(original_ms - len(segment)) / 1000,
+        bytes_saved=max(0, len(pcm) - len(processed)),
+    )
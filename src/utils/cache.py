@@ -0,0 +1,167 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import typing
+from collections import OrderedDict
+
+from utils.recognizers import Recognition
+
+
+class TTLCache:
+    def __init__(self, max_size: int = 512, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # key -> (expires_at, value), oldest first
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key) -> typing.Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        self.misses += 1
+        return None
+
+    def set(self, key, value, expires_at: typing.Optional[float] = None):
+        if expires_at is None:
+            expires_at = time.time() + self.ttl
+
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def pop(self, key) -> typing.Any:
+        entry = self._entries.pop(key, None)
+        if entry is None or entry[0] <= time.time():
+            return None
+        return entry[1]
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self)}
+
+
+class TieredCache:
+    def __init__(
+        self,
+        table: str,
+        max_size: int = 512,
+        ttl: float = 86400,
+        db_path: typing.Optional[str] = None,
+        encode: typing.Callable[[typing.Any], str] = str,
+        decode: typing.Callable[[str], typing.Any] = str,
+    ):
+        self.memory = TTLCache(max_size, ttl)
+        self.table = table
+        self.ttl = ttl
+        self.encode = encode
+        self.decode = decode
+        self.hits = 0
+        self.misses = 0
+
+        # optional on-disk tier that survives restarts and is shared by cluster processes,
+        # queried from worker threads since another process can hold its lock for a while
+        self.db = None
+        self.lock = threading.Lock()
+        if db_path:
+            self.db = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self.db.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}_expires_at ON {table} (expires_at)"
+            )
+            self.db.execute(
+                f"DELETE FROM {table} WHERE expires_at <= ?", (time.time(),)
+            )
+            self.db.commit()
+
+    async def get(self, key) -> typing.Any:
+        value = self.memory.get(key)
+
+        if value is None and self.db is not None:
+            row = await asyncio.to_thread(self._select, str(key))
+            if row:
+                value = self.decode(row[0])
+                self.memory.set(key, value, expires_at=row[1])
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key, value):
+        expires_at = time.time() + self.ttl
+        self.memory.set(key, value, expires_at=expires_at)
+
+        if self.db is not None:
+            await asyncio.to_thread(
+                self._insert, str(key), self.encode(value), expires_at
+            )
+
+    def _select(self, key: str):
+        with self.lock:
+            return self.db.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+
+    def _insert(self, key: str, value: str, expires_at: float):
+        with self.lock:
+            self.db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            self.db.execute(
+                f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),)
+            )
+            self.db.commit()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.memory)}
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+
+class TranscriptCache(TieredCache):
+    def __init__(
+        self,
+        max_size: int = 512,
+        ttl: float = 86400,
+        db_path: typing.Optional[str] = None,
+    ):
+        super().__init__(
+            "transcripts",
+            max_size,
+            ttl,
+            db_path,
+            encode=lambda recognition: json.dumps(list(recognition)),
+            decode=lambda value: Recognition(*json.loads(value)),
+        )
+
+
+def attachment_key(attachment_id: int) -> str:
+    return f"attachment:{attachment_id}"
+
+
+# the same audio recognized with different candidate languages is a different transcript
+def language_key(key: str, languages: typing.Sequence[str] = ()) -> str:
+    return f"{key}:{','.join(languages) or 'auto'}"
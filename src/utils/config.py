@@ -0,0 +1,96 @@
+import functools
+import json
+import os
+import typing
+from collections import defaultdict
+
+from discord import app_commands
+
+CONFIG_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "config", "config.json"
+)
+
+POPULAR_LANGUAGES = [
+    "EN-US",
+    "ES",
+    "FR",
+    "DE",
+    "JA",
+    "ZH",
+    "PT-BR",
+    "RU",
+    "IT",
+    "NL",
+]
+
+
+# read once and shared by every cog
+@functools.lru_cache(maxsize=None)
+def load_config() -> dict:
+    with open(CONFIG_PATH) as conf_file:
+        return json.load(conf_file)
+
+
+class LanguageIndex:
+    def __init__(self, language_codes: typing.Dict[str, str], page_size: int = 18):
+        self.language_codes = language_codes
+
+        self.choices = {
+            code: app_commands.Choice(name=f"{code} - {name}", value=code)
+            for code, name in language_codes.items()
+        }
+        self.popular_choices = [
+            self.choices[code] for code in POPULAR_LANGUAGES if code in self.choices
+        ][:25]
+
+        # every prefix of every code, and every substring of every name, mapped to
+        # the codes they match in config order
+        self.code_prefixes = defaultdict(list)
+        self.name_substrings = defaultdict(list)
+        for code, name in language_codes.items():
+            for end in range(1, len(code) + 1):
+                self.code_prefixes[code[:end]].append(code)
+
+            name_lower = name.lower()
+            substrings = {
+                name_lower[start:end]
+                for start in range(len(name_lower))
+                for end in range(start + 1, len(name_lower) + 1)
+            }
+            for substring in substrings:
+                self.name_substrings[substring].append(code)
+
+        # /languages pages, sorted by name
+        sorted_codes = sorted(language_codes.items(), key=lambda x: x[1])
+        self.pages = [
+            sorted_codes[i : i + page_size]
+            for i in range(0, len(sorted_codes), page_size)
+        ]
+
+        self.search = functools.lru_cache(maxsize=2048)(self._search)
+
+    def _search(self, current: str) -> typing.List[app_commands.Choice[str]]:
+        if not current:
+            return self.popular_choices
+
+        current_upper = current.upper()
+        exact_matches = [current_upper] if current_upper in self.choices else []
+        code_matches = [
+            code
+            for code in self.code_prefixes.get(current_upper, ())
+            if code != current_upper
+        ]
+        matched = set(exact_matches) | set(code_matches)
+        name_matches = [
+            code
+            for code in self.name_substrings.get(current.lower(), ())
+            if code not in matched
+        ]
+
+        all_matches = exact_matches + code_matches + name_matches
+        return [self.choices[code] for code in all_matches[:25]]
+
+
+@functools.lru_cache(maxsize=None)
+def get_language_index() -> LanguageIndex:
+    return LanguageIndex(load_config()["language_codes"])
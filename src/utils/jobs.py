@@ -0,0 +1,136 @@
+import asyncio
+import sqlite3
+import threading
+import time
+import typing
+
+import discord
+
+from utils.voice_note import VoiceNote
+
+# discord stops accepting followups on an interaction token after 15 minutes
+TOKEN_LIFETIME = 15 * 60
+
+
+# a deferred /transcribe, with everything needed to answer it from another process
+class Job(typing.NamedTuple):
+    interaction_id: int
+    application_id: int
+    token: str
+    created_at: float
+    user_name: str
+    note: VoiceNote
+    translate_to: typing.Optional[str] = None
+    public: bool = False
+    # candidate spoken languages, most likely first
+    languages: typing.Tuple[str, ...] = ()
+    # the progress message, so a resumed job edits it instead of posting a second one
+    message_id: typing.Optional[int] = None
+
+    @classmethod
+    def from_interaction(
+        cls,
+        interaction: discord.Interaction,
+        note: VoiceNote,
+        translate_to: typing.Optional[str] = None,
+        public: bool = False,
+        languages: typing.Sequence[str] = (),
+    ) -> "Job":
+        return cls(
+            interaction_id=interaction.id,
+            application_id=interaction.application_id,
+            token=interaction.token,
+            created_at=interaction.created_at.timestamp(),
+            user_name=interaction.user.name,
+            note=note,
+            translate_to=translate_to,
+            public=public,
+            languages=tuple(languages),
+        )
+
+    def expired(self, margin: float = 30) -> bool:
+        return self.created_at + TOKEN_LIFETIME <= time.time() + margin
+
+
+class JobJournal:
+    def __init__(self, db_path: str):
+        # written from worker threads so a slow commit never stalls the event loop
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (interaction_id INTEGER PRIMARY KEY, application_id INTEGER NOT NULL, token TEXT NOT NULL, created_at REAL NOT NULL, user_name TEXT NOT NULL, note TEXT NOT NULL, translate_to TEXT, public INTEGER NOT NULL, languages TEXT NOT NULL, message_id INTEGER)"
+        )
+        self.db.commit()
+
+    async def add(self, job: Job):
+        await asyncio.to_thread(
+            self._write,
+            "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                job.interaction_id,
+                job.application_id,
+                job.token,
+                job.created_at,
+                job.user_name,
+                job.note.to_json(),
+                job.translate_to,
+                int(job.public),
+                ",".join(job.languages),
+                job.message_id,
+            ),
+        )
+
+    async def set_message(self, interaction_id: int, message_id: int):
+        await asyncio.to_thread(
+            self._write,
+            "UPDATE jobs SET message_id = ? WHERE interaction_id = ?",
+            (message_id, interaction_id),
+        )
+
+    async def remove(self, interaction_id: int):
+        await asyncio.to_thread(
+            self._write, "DELETE FROM jobs WHERE interaction_id = ?", (interaction_id,)
+        )
+
+    async def pending(self) -> typing.List[Job]:
+        # jobs whose token already ran out can't be answered anymore
+        await asyncio.to_thread(
+            self._write,
+            "DELETE FROM jobs WHERE created_at <= ?",
+            (time.time() - TOKEN_LIFETIME,),
+        )
+
+        rows = await asyncio.to_thread(
+            self._read, "SELECT * FROM jobs ORDER BY created_at"
+        )
+        return [
+            Job(
+                interaction_id=row[0],
+                application_id=row[1],
+                token=row[2],
+                created_at=row[3],
+                user_name=row[4],
+                note=VoiceNote.from_json(row[5]),
+                translate_to=row[6],
+                public=bool(row[7]),
+                languages=tuple(filter(None, row[8].split(","))),
+                message_id=row[9],
+            )
+            for row in rows
+        ]
+
+    def _write(self, sql: str, params: tuple = ()):
+        with self.lock:
+            self.db.execute(sql, params)
+            self.db.commit()
+
+    def _read(self, sql: str, params: tuple = ()) -> list:
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
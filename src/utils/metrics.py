@@ -0,0 +1,89 @@
+import contextlib
+import time
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+REQUESTS = Counter(
+    "vmt_transcription_requests_total",
+    "Transcriptions started, by where they came from",
+    ["source"],
+)
+FAILURES = Counter(
+    "vmt_stage_failures_total",
+    "Pipeline stages that raised, by exception type",
+    ["stage", "exception"],
+)
+STAGE_SECONDS = Histogram(
+    "vmt_stage_duration_seconds",
+    "Time spent in each stage of the transcription pipeline",
+    ["stage"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+CACHE_LOOKUPS = Counter(
+    "vmt_cache_lookups_total", "Cache lookups, by cache and result", ["cache", "result"]
+)
+COALESCED = Counter(
+    "vmt_coalesced_requests_total",
+    "Requests that joined an identical call already in progress, by registry",
+    ["registry"],
+)
+QUEUE_DEPTH = Gauge(
+    "vmt_queue_depth", "Transcriptions currently admitted to the worker pool"
+)
+BACKGROUND_QUEUE_DEPTH = Gauge(
+    "vmt_background_queue_depth",
+    "Voice messages waiting to be transcribed for servers with auto transcription",
+)
+AUDIO_SECONDS = Counter("vmt_audio_seconds_total", "Seconds of audio decoded")
+PREPROCESS_SAVED_SECONDS = Counter(
+    "vmt_preprocess_saved_seconds_total",
+    "Seconds of silence trimmed before recognition",
+)
+PREPROCESS_SAVED_BYTES = Counter(
+    "vmt_preprocess_saved_bytes_total",
+    "Bytes of decoded audio trimmed before recognition",
+)
+TRANSLATIONS_SKIPPED = Counter(
+    "vmt_translations_skipped_total",
+    "Translations not sent to deepl because the speech was already in that language",
+)
+BREAKER_STATE = Gauge(
+    "vmt_circuit_breaker_state",
+    "Circuit breaker state per upstream, 0 closed, 1 half open, 2 open",
+    ["upstream"],
+)
+HEDGED = Counter(
+    "vmt_hedged_requests_total",
+    "Extra attempts started because an upstream call was slow",
+    ["upstream"],
+)
+UPSTREAM_TIMEOUTS = Counter(
+    "vmt_upstream_timeouts_total",
+    "Upstream calls that missed their deadline",
+    ["upstream"],
+)
+REJECTED = Counter(
+    "vmt_rejected_total", "Requests turned away before any work, by reason", ["reason"]
+)
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        FAILURES.labels(name, type(e).__name__).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+
+def cache_lookup(cache: str, value):
+    CACHE_LOOKUPS.labels(cache, "miss" if value is None else "hit").inc()
+    return value
+
+
+def start_metrics_server(port: int, addr: str = "127.0.0.1"):
+    # serves /metrics from a daemon thread
+    start_http_server(port, addr=addr)
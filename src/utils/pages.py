@@ -0,0 +1,95 @@
+import typing
+
+import discord
+
+# pager name -> renders its pages for the client, registered by the cog that owns it
+PAGERS: typing.Dict[
+    str, typing.Callable[[discord.Client], typing.List[discord.Embed]]
+] = {}
+
+
+class PageButton(
+    discord.ui.DynamicItem[discord.ui.Button],
+    template=r"vmt:(?P<pager>[a-z]+):(?P<page>[0-9]+):(?P<owner>[0-9]+)",
+):
+    # the pager, the page it leads to and who may press it live in the custom id, so
+    # any process answers it, even after a restart, without keeping a view around
+    def __init__(
+        self, pager: str, page: int, owner: int, label: str, disabled: bool = False
+    ):
+        super().__init__(
+            discord.ui.Button(
+                label=label,
+                style=discord.ButtonStyle.blurple,
+                custom_id=f"vmt:{pager}:{page}:{owner}",
+                disabled=disabled,
+            )
+        )
+        self.pager = pager
+        self.page = page
+        self.owner = owner
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(match["pager"], int(match["page"]), int(match["owner"]), item.label)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.owner:
+            await interaction.response.send_message(
+                "This isn't your menu!", ephemeral=True
+            )
+            return False
+        return True
+
+    async def callback(self, interaction: discord.Interaction):
+        render = PAGERS.get(self.pager)
+        if render is None:
+            await interaction.response.send_message(
+                "This menu is no longer available.", ephemeral=True
+            )
+            return
+
+        embeds = render(interaction.client)
+        # there may be fewer pages than when the message was sent
+        page = min(self.page, len(embeds) - 1)
+        await interaction.response.edit_message(
+            embed=embeds[page],
+            view=page_view(self.pager, page, self.owner, len(embeds)),
+        )
+
+
+def page_view(pager: str, page: int, owner: int, total_pages: int) -> discord.ui.View:
+    view = discord.ui.View(timeout=None)
+    if total_pages > 1:
+        view.add_item(
+            PageButton(pager, max(page - 1, 0), owner, "◀", disabled=page == 0)
+        )
+        view.add_item(
+            PageButton(
+                pager,
+                min(page + 1, total_pages - 1),
+                owner,
+                "▶",
+                disabled=page >= total_pages - 1,
+            )
+        )
+    # presses are routed by the registered PageButton, so the view is never stored
+    # and has no timeout task
+    view.stop()
+    return view
+
+
+def add_pager(
+    bot: discord.Client,
+    pager: str,
+    render: typing.Callable[[discord.Client], typing.List[discord.Embed]],
+):
+    PAGERS[pager] = render
+    bot.add_dynamic_items(PageButton)
+
+
+def remove_pager(bot: discord.Client, pager: str):
+    PAGERS.pop(pager, None)
+    # other cogs' pagers still need the button routed
+    if not PAGERS:
+        bot.remove_dynamic_items(PageButton)
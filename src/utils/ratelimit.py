@@ -0,0 +1,169 @@
+import sqlite3
+import threading
+import time
+import typing
+
+from utils.cache import TTLCache
+
+
+class TokenBucket:
+    __slots__ = ("capacity", "refill_rate", "tokens", "updated_at")
+
+    def __init__(self, capacity: float, per: float):
+        self.capacity = capacity
+        self.refill_rate = capacity / per
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def retry_after(self, now: float) -> float:
+        # a bucket created after `now` was read hasn't refilled, rather than drained
+        elapsed = max(0.0, now - self.updated_at)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate)
+        self.updated_at = max(now, self.updated_at)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.refill_rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+def parse_rate(
+    value: typing.Optional[str],
+) -> typing.Optional[typing.Tuple[int, float]]:
+    # "3/60" means 3 requests per 60 seconds, empty disables the limit
+    if not value:
+        return None
+    count, per = value.split("/", 1)
+    return int(count), float(per)
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        user: typing.Optional[typing.Tuple[int, float]] = None,
+        guild: typing.Optional[typing.Tuple[int, float]] = None,
+        global_: typing.Optional[typing.Tuple[int, float]] = None,
+        max_buckets: int = 10000,
+        db_path: typing.Optional[str] = None,
+    ):
+        self.user = user
+        self.guild = guild
+        self.global_ = global_
+        # idle buckets are full again after `per` seconds, so they can be forgotten by then
+        self.user_buckets = TTLCache(max_buckets, user[1] if user else 0)
+        self.guild_buckets = TTLCache(max_buckets, guild[1] if guild else 0)
+        self.global_bucket = TokenBucket(*global_) if global_ else None
+        self.longest_period = max(
+            (limit[1] for limit in (user, guild, global_) if limit), default=0
+        )
+
+        # cluster processes share their buckets through sqlite, otherwise every process
+        # would allow the full rate on its own. it blocks, so callers use a worker thread
+        self.db = None
+        self.lock = threading.Lock()
+        if db_path:
+            self.db = sqlite3.connect(
+                db_path, timeout=10, check_same_thread=False, isolation_level=None
+            )
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS rate_buckets_updated_at ON rate_buckets (updated_at)"
+            )
+
+    def _bucket(self, buckets: TTLCache, key, limit) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(*limit)
+        # refresh the expiry on every use
+        buckets.set(key, bucket)
+        return bucket
+
+    def _buckets(self, user_id: int, guild_id: typing.Optional[int]):
+        buckets = []
+        if self.user:
+            buckets.append(self._bucket(self.user_buckets, user_id, self.user))
+        if self.guild and guild_id is not None:
+            buckets.append(self._bucket(self.guild_buckets, guild_id, self.guild))
+        if self.global_bucket:
+            buckets.append(self.global_bucket)
+        return buckets
+
+    def _limits(self, user_id: int, guild_id: typing.Optional[int]):
+        limits = []
+        if self.user:
+            limits.append((f"user:{user_id}", self.user))
+        if self.guild and guild_id is not None:
+            limits.append((f"guild:{guild_id}", self.guild))
+        if self.global_:
+            limits.append(("global", self.global_))
+        return limits
+
+    def acquire(self, user_id: int, guild_id: typing.Optional[int]) -> float:
+        if self.db is not None:
+            return self._shared(user_id, guild_id)
+
+        # only spend tokens when every bucket has one, so a rejected call costs nothing
+        now = time.monotonic()
+        buckets = self._buckets(user_id, guild_id)
+        retry_after = max((bucket.retry_after(now) for bucket in buckets), default=0.0)
+        if retry_after > 0:
+            return retry_after
+
+        for bucket in buckets:
+            bucket.take()
+        return 0.0
+
+    def _shared(self, user_id: int, guild_id: typing.Optional[int]) -> float:
+        # wall clock time, monotonic clocks aren't comparable between processes
+        now = time.time()
+        limits = self._limits(user_id, guild_id)
+        with self.lock:
+            # the write lock is taken up front so no other process spends the same token
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                buckets = []
+                for key, limit in limits:
+                    bucket = TokenBucket(*limit)
+                    bucket.updated_at = now
+                    row = self.db.execute(
+                        "SELECT tokens, updated_at FROM rate_buckets WHERE key = ?",
+                        (key,),
+                    ).fetchone()
+                    if row:
+                        bucket.tokens, bucket.updated_at = row
+                    buckets.append((key, bucket))
+
+                retry_after = max(
+                    (bucket.retry_after(now) for _, bucket in buckets), default=0.0
+                )
+                if retry_after <= 0:
+                    for _, bucket in buckets:
+                        bucket.take()
+
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    [
+                        (key, bucket.tokens, bucket.updated_at)
+                        for key, bucket in buckets
+                    ],
+                )
+                # a bucket left alone for its whole period is full again, same as no row
+                self.db.execute(
+                    "DELETE FROM rate_buckets WHERE updated_at <= ?",
+                    (now - self.longest_period,),
+                )
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        return retry_after
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
@@ -0,0 +1,149 @@
+import json
+import os
+import typing
+
+import speech_recognition as sr
+
+from utils.audio import SAMPLE_RATE, SAMPLE_WIDTH
+
+# a google result this confident is taken without trying the other candidate languages
+CONFIDENT = 0.85
+
+
+class Recognition(typing.NamedTuple):
+    text: str
+    # bcp 47 tag the speech was detected as (e.g. "es-ES" or "es"), None when the
+    # backend was only told which language to expect
+    language: typing.Optional[str] = None
+
+
+class SpeechBackend:
+    name = "base"
+    # whether recognize() depends on the candidate languages it's given
+    uses_language_hint = False
+    # network backends get hedged retries, a second local run would only compete for cpu
+    remote = False
+
+    # called from the recognizer thread pool with 16 khz mono 16-bit pcm and the
+    # candidate languages, most likely first
+    def recognize(
+        self, pcm: bytes, languages: typing.Sequence[str] = ()
+    ) -> Recognition:
+        raise NotImplementedError
+
+
+class GoogleBackend(SpeechBackend):
+    name = "google"
+    uses_language_hint = True
+    remote = True
+
+    def __init__(self, timeout: typing.Optional[float] = None):
+        # bounds the http call itself, so a hung request doesn't hold a worker thread
+        self.timeout = timeout
+
+    def recognize(
+        self, pcm: bytes, languages: typing.Sequence[str] = ()
+    ) -> Recognition:
+        audio_data = sr.AudioData(pcm, SAMPLE_RATE, SAMPLE_WIDTH)
+        recognizer = sr.Recognizer()
+        recognizer.operation_timeout = self.timeout
+        # a single candidate is only a hint, the speech may well be in another language,
+        # so it isn't reported as the detected one
+        if len(languages) <= 1:
+            language = languages[0] if languages else "en-US"
+            return Recognition(
+                recognizer.recognize_google(audio_data, language=language)
+            )
+
+        # google doesn't detect the language, so the most confident candidate wins
+        best = None
+        for language in languages:
+            try:
+                text, confidence = recognizer.recognize_google(
+                    audio_data, language=language, with_confidence=True
+                )
+            except sr.UnknownValueError:
+                continue
+            if best is None or confidence > best[0]:
+                best = (confidence, Recognition(text, language))
+            if confidence >= CONFIDENT:
+                break
+
+        if best is None:
+            raise sr.UnknownValueError()
+        return best[1]
+
+
+class VoskBackend(SpeechBackend):
+    name = "vosk"
+
+    def __init__(self, model_path: str):
+        import vosk
+
+        self.vosk = vosk
+        # the model is read-only once loaded, so every worker thread shares it
+        self.model = vosk.Model(model_path)
+
+    # a vosk model only knows one language, so the hint has nothing to pick from
+    def recognize(
+        self, pcm: bytes, languages: typing.Sequence[str] = ()
+    ) -> Recognition:
+        recognizer = self.vosk.KaldiRecognizer(self.model, SAMPLE_RATE)
+        recognizer.AcceptWaveform(pcm)
+        text = json.loads(recognizer.FinalResult()).get("text", "").strip()
+        if not text:
+            raise sr.UnknownValueError()
+        return Recognition(text)
+
+
+class WhisperBackend(SpeechBackend):
+    name = "whisper"
+
+    def __init__(self, model: str, compute_type: str = "int8", workers: int = 1):
+        from faster_whisper import WhisperModel
+        import numpy
+
+        self.numpy = numpy
+        self.model = WhisperModel(
+            model, device="cpu", compute_type=compute_type, num_workers=workers
+        )
+
+    # whisper detects the spoken language itself, which beats any locale based guess
+    def recognize(
+        self, pcm: bytes, languages: typing.Sequence[str] = ()
+    ) -> Recognition:
+        audio = (
+            self.numpy.frombuffer(pcm, self.numpy.int16).astype(self.numpy.float32)
+            / 32768.0
+        )
+        segments, info = self.model.transcribe(audio, beam_size=1)
+        text = " ".join(segment.text.strip() for segment in segments).strip()
+        if not text:
+            raise sr.UnknownValueError()
+        return Recognition(text, info.language)
+
+
+def load_backend() -> SpeechBackend:
+    backend = os.getenv("SPEECH_BACKEND", "google").lower()
+
+    if backend == "google":
+        return GoogleBackend(timeout=float(os.getenv("RECOGNIZE_TIMEOUT", "30")))
+
+    if backend == "vosk":
+        model_path = os.getenv("VOSK_MODEL_PATH")
+        if not model_path:
+            raise ValueError(
+                "VOSK_MODEL_PATH not found in environment variables! Please set it in your .env file"
+            )
+        return VoskBackend(model_path)
+
+    if backend == "whisper":
+        return WhisperBackend(
+            os.getenv("WHISPER_MODEL", "base"),
+            compute_type=os.getenv("WHISPER_COMPUTE_TYPE", "int8"),
+            workers=int(os.getenv("RECOGNIZE_WORKERS", "4")),
+        )
+
+    raise ValueError(
+        f"Unknown SPEECH_BACKEND '{backend}'! Use one of: google, vosk, whisper"
+    )
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import time
+import typing
+
+from utils import metrics
+
+log = logging.getLogger(__name__)
+
+# values of the vmt_circuit_breaker_state gauge
+CLOSED = 0
+HALF_OPEN = 1
+OPEN = 2
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_after: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+        self._set_state(CLOSED)
+
+    def _set_state(self, state: int):
+        self.state = state
+        metrics.BREAKER_STATE.labels(self.name).set(state)
+
+    def available(self) -> bool:
+        if self.state == OPEN:
+            return time.monotonic() - self.opened_at >= self.reset_after
+        return not (self.state == HALF_OPEN and self.trial_running)
+
+    def allow(self) -> bool:
+        if not self.available():
+            return False
+        # after the cool down a single trial call decides whether the upstream is back
+        if self.state == OPEN:
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            self.trial_running = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.trial_running = False
+        if self.state != CLOSED:
+            log.info("circuit breaker closed upstream=%s", self.name)
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_running = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                log.warning(
+                    "circuit breaker opened upstream=%s failures=%s",
+                    self.name,
+                    self.failures,
+                )
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+
+class Upstream:
+    def __init__(
+        self,
+        name: str,
+        timeout: float = 30,
+        hedge_after: float = 0,
+        attempts: int = 2,
+        failure_threshold: int = 5,
+        reset_after: float = 30,
+        answers: typing.Tuple[typing.Type[BaseException], ...] = (),
+    ):
+        self.name = name
+        self.timeout = timeout
+        # a second attempt starts once the first has been running this long, 0 disables
+        self.hedge_after = hedge_after
+        self.attempts = attempts
+        # exceptions that are a real answer from the upstream rather than a failure
+        self.answers = answers
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_after)
+
+    def available(self) -> bool:
+        return self.breaker.available()
+
+    async def call(
+        self,
+        func: typing.Callable[[], typing.Awaitable[typing.Any]],
+        spare: typing.Optional[typing.Callable[[], bool]] = None,
+    ):
+        # spare says whether another attempt could start right away, when it's given
+        # hedges and retries only happen then instead of queueing behind other work
+        if not self.breaker.allow():
+            metrics.REJECTED.labels(f"{self.name}_unavailable").inc()
+            raise CircuitOpenError(f"{self.name} is unavailable")
+
+        try:
+            result = await self._hedged(func, spare)
+        except self.answers:
+            self.breaker.record_success()
+            raise
+        except asyncio.CancelledError:
+            # the caller gave up, which says nothing about the upstream
+            self.breaker.trial_running = False
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+
+        self.breaker.record_success()
+        return result
+
+    async def _hedged(self, func, spare=None):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        tasks = {asyncio.ensure_future(func())}
+        started = 1
+        error = None
+        try:
+            while tasks:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    metrics.UPSTREAM_TIMEOUTS.labels(self.name).inc()
+                    raise TimeoutError(f"{self.name} took over {self.timeout}s")
+
+                can_hedge = self.hedge_after and started < self.attempts
+                done, _ = await asyncio.wait(
+                    tasks,
+                    timeout=(
+                        min(self.hedge_after, remaining) if can_hedge else remaining
+                    ),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    tasks.discard(task)
+                    if task.exception() is None or isinstance(
+                        task.exception(), self.answers
+                    ):
+                        return task.result()
+                    error = task.exception()
+
+                # slow or failed, either way another attempt may get there first
+                if (
+                    started < self.attempts
+                    and (not done or not tasks)
+                    and (spare is None or spare())
+                ):
+                    if not done:
+                        metrics.HEDGED.labels(self.name).inc()
+                    tasks.add(asyncio.ensure_future(func()))
+                    started += 1
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,57 @@
+import asyncio
+import sqlite3
+import threading
+import typing
+
+
+class GuildSettings:
+    def __init__(self, db_path: typing.Optional[str] = None):
+        # guilds that opted in to automatic transcription, checked on every message
+        self.auto_transcribe = set()
+
+        # a guild's messages and commands all reach the process owning its shard, so
+        # the in-memory set stays accurate even when cluster processes share the file
+        self.db = None
+        self.lock = threading.Lock()
+        if db_path:
+            self.db = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS auto_transcribe (guild_id INTEGER PRIMARY KEY)"
+            )
+            self.db.commit()
+            self.auto_transcribe = {
+                row[0]
+                for row in self.db.execute("SELECT guild_id FROM auto_transcribe")
+            }
+
+    def auto_transcribe_enabled(self, guild_id: typing.Optional[int]) -> bool:
+        return guild_id in self.auto_transcribe
+
+    async def set_auto_transcribe(self, guild_id: int, enabled: bool):
+        if enabled:
+            self.auto_transcribe.add(guild_id)
+        else:
+            self.auto_transcribe.discard(guild_id)
+
+        if self.db is not None:
+            await asyncio.to_thread(self._store, guild_id, enabled)
+
+    def _store(self, guild_id: int, enabled: bool):
+        with self.lock:
+            if enabled:
+                self.db.execute(
+                    "INSERT OR IGNORE INTO auto_transcribe (guild_id) VALUES (?)",
+                    (guild_id,),
+                )
+            else:
+                self.db.execute(
+                    "DELETE FROM auto_transcribe WHERE guild_id = ?", (guild_id,)
+                )
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
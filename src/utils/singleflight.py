@@ -0,0 +1,76 @@
+import asyncio
+import typing
+
+from utils import metrics
+
+
+class Flight(typing.NamedTuple):
+    task: asyncio.Task
+    # progress callbacks of everyone currently waiting on the task
+    listeners: typing.List[typing.Callable[..., typing.Awaitable[None]]]
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        # key -> the one call in progress for it, shared by everyone asking meanwhile
+        self.flights = {}
+
+    def __contains__(self, key) -> bool:
+        return key in self.flights
+
+    def __len__(self):
+        return len(self.flights)
+
+    def start(self, key, func, *args) -> asyncio.Task:
+        flight = self.flights.get(key)
+        if flight is not None:
+            metrics.COALESCED.labels(self.name).inc()
+            return flight.task
+
+        flight = Flight(asyncio.create_task(func(*args)), [])
+        self.flights[key] = flight
+        flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        return flight.task
+
+    async def do(
+        self,
+        key,
+        func,
+        *args,
+        listener: typing.Optional[typing.Callable[..., typing.Awaitable[None]]] = None,
+    ):
+        task = self.start(key, func, *args)
+        flight = self.flights.get(key)
+        if listener is not None and flight is not None:
+            flight.listeners.append(listener)
+        try:
+            # one caller giving up must not cancel the call for everyone else
+            return await asyncio.shield(task)
+        finally:
+            if listener is not None and flight is not None:
+                flight.listeners.remove(listener)
+
+    def notifier(self, key) -> typing.Callable[..., typing.Awaitable[None]]:
+        # fans progress out to every waiter, one failing listener doesn't affect the rest
+        async def notify(*progress):
+            flight = self.flights.get(key)
+            if flight is None:
+                return
+            await asyncio.gather(
+                *(listener(*progress) for listener in list(flight.listeners)),
+                return_exceptions=True,
+            )
+
+        return notify
+
+    def cancel_all(self):
+        for flight in list(self.flights.values()):
+            flight.task.cancel()
+
+    def _forget(self, key, flight: Flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        # waiters that gave up never see the result, don't warn about it
+        if not flight.task.cancelled():
+            flight.task.exception()
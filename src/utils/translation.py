@@ -0,0 +1,137 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import logging
+import typing
+
+import deepl
+import deepl.http_client
+
+from utils import metrics
+from utils.cache import TTLCache
+from utils.resilience import Upstream
+from utils.singleflight import SingleFlight
+
+log = logging.getLogger(__name__)
+
+
+class Translator:
+    def __init__(
+        self,
+        auth_key: str,
+        server_url: typing.Optional[str] = None,
+        cache_size: int = 1024,
+        cache_ttl: float = 86400,
+        timeout: float = 10,
+        hedge_after: float = 3,
+        failure_threshold: int = 5,
+        reset_after: float = 30,
+        workers: int = 4,
+    ):
+        # retries and slow attempts are handled by the upstream below, so a single
+        # deepl call mustn't retry on its own or outlive the deadline
+        deepl.http_client.max_network_retries = 0
+        deepl.http_client.min_connection_timeout = timeout
+
+        # one client for the lifetime of the cog so its http session and connections are reused
+        self.deepl = deepl.Translator(auth_key=auth_key, server_url=server_url)
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self.in_flight = SingleFlight("translation")
+        # translate_text blocks, it gets its own threads so a slow deepl can't take up
+        # the default executor everything else uses
+        self.workers = workers
+        self.running = 0
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="vmt-translate"
+        )
+        # while deepl is down translations fail fast and transcripts go out without them
+        self.upstream = Upstream(
+            "deepl",
+            timeout=timeout,
+            hedge_after=hedge_after,
+            failure_threshold=failure_threshold,
+            reset_after=reset_after,
+        )
+
+    async def translate(self, text: str, target_lang: str) -> str:
+        key = (hashlib.sha256(text.encode()).hexdigest(), target_lang)
+        translated_text = metrics.cache_lookup("translation", self.cache.get(key))
+        if translated_text is not None:
+            return translated_text
+
+        # the same transcript translated into the same language for several users at once
+        return await self.in_flight.do(key, self._translate, key, text, target_lang)
+
+    async def _translate(self, key, text: str, target_lang: str) -> str:
+        # a hedge only starts while a translation thread is idle
+        result = await self.upstream.call(
+            lambda: self._run(text, target_lang),
+            spare=lambda: self.running < self.workers,
+        )
+        translated_text = result.text if hasattr(result, "text") else str(result)
+
+        self.cache.set(key, translated_text)
+        return translated_text
+
+    async def translate_many(
+        self,
+        text: str,
+        target_langs: typing.List[str],
+        source_lang: typing.Optional[str] = None,
+    ) -> typing.Dict[str, str]:
+        # text detected to already be in a target language skips the deepl round trip,
+        # without a detected source language everything is translated
+        translations = {}
+        for target_lang in target_langs:
+            if same_language(source_lang, target_lang):
+                metrics.TRANSLATIONS_SKIPPED.inc()
+                translations[target_lang] = text
+        pending = [lang for lang in target_langs if lang not in translations]
+
+        # deepl takes one target language per request, so they all go out at once
+        results = await asyncio.gather(
+            *(self.translate(text, target_lang) for target_lang in pending),
+            return_exceptions=True,
+        )
+
+        for target_lang, result in zip(pending, results):
+            if isinstance(result, Exception):
+                log.warning(
+                    "translation failed target=%s error=%r", target_lang, result
+                )
+                continue
+            translations[target_lang] = result
+        return {
+            lang: translations[lang] for lang in target_langs if lang in translations
+        }
+
+    async def _run(self, text: str, target_lang: str):
+        # counted until the thread is really done, a cancelled call keeps running
+        loop = asyncio.get_running_loop()
+        self.running += 1
+        future = self.executor.submit(
+            self.deepl.translate_text, text, target_lang=target_lang
+        )
+        future.add_done_callback(lambda _: self._finished(loop))
+        return await asyncio.wrap_future(future)
+
+    def _finished(self, loop: asyncio.AbstractEventLoop):
+        try:
+            loop.call_soon_threadsafe(self._decrement)
+        except RuntimeError:
+            # the loop already closed
+            pass
+
+    def _decrement(self):
+        self.running -= 1
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.deepl.close()
+
+
+# "en-GB" speech is close enough to "EN-US" that a translation would change nothing
+def same_language(source: typing.Optional[str], target: str) -> bool:
+    if not source:
+        return False
+    return source.split("-")[0].lower() == target.split("-")[0].lower()
@@ -0,0 +1,84 @@
+import json
+import time
+import typing
+import urllib.parse
+
+import discord
+
+
+# everything the pipeline needs from a voice message, without holding on to the message itself
+class VoiceNote(typing.NamedTuple):
+    channel_id: int
+    message_id: int
+    attachment_id: int
+    url: str
+    size: int
+    duration: typing.Optional[float]
+    author_name: str
+    content_type: typing.Optional[str] = None
+
+    @classmethod
+    def from_message(cls, message: discord.Message) -> "VoiceNote":
+        attachment = message.attachments[0]
+        return cls(
+            channel_id=message.channel.id,
+            message_id=message.id,
+            attachment_id=attachment.id,
+            url=attachment.url,
+            size=attachment.size,
+            duration=getattr(attachment, "duration_secs", None),
+            author_name=message.author.name,
+            content_type=attachment.content_type,
+        )
+
+    def to_json(self) -> str:
+        return json.dumps(list(self))
+
+    @classmethod
+    def from_json(cls, value: str) -> "VoiceNote":
+        return cls(*json.loads(value))
+
+    def url_expired(self, margin: float = 60) -> bool:
+        # discord cdn links are signed and carry their expiry as a hex timestamp in `ex`
+        expires = urllib.parse.parse_qs(urllib.parse.urlsplit(self.url).query).get("ex")
+        if not expires:
+            return False
+        try:
+            return int(expires[0], 16) <= time.time() + margin
+        except ValueError:
+            return False
+
+
+class Admission(typing.NamedTuple):
+    allowed: bool
+    reason: typing.Optional[str] = None
+    # decoding stops here, even when the attachment doesn't report its duration
+    max_seconds: typing.Optional[float] = None
+    truncated: bool = False
+
+
+# decided from attachment metadata alone, before a single byte is downloaded
+def admit(
+    note: VoiceNote,
+    max_duration: float,
+    max_bytes: int,
+    truncate_overlong: bool = False,
+) -> Admission:
+    if note.content_type and not note.content_type.startswith("audio/"):
+        return Admission(False, "This message does not contain a voice message.")
+
+    if note.size and note.size > max_bytes:
+        return Admission(
+            False,
+            f"Voice message is too large. Maximum size is {max_bytes / (1024 * 1024):g} MB.",
+        )
+
+    if note.duration and note.duration > max_duration:
+        if not truncate_overlong:
+            return Admission(
+                False,
+                f"Voice message is too long. Maximum duration is {int(max_duration)} seconds. This voice message is {int(note.duration)} seconds.",
+            )
+        return Admission(True, max_seconds=max_duration, truncated=True)
+
+    return Admission(True, max_seconds=max_duration)
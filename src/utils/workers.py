@@ -0,0 +1,117 @@
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import typing
+
+
+class PoolBusyError(Exception):
+    pass
+
+
+class AudioWorkerPool:
+    def __init__(
+        self, decode_workers: int = 2, recognize_workers: int = 4, max_queue: int = 16
+    ):
+        # decoding happens in ffmpeg subprocesses, recognition is blocking network io
+        self.decode_slots = asyncio.Semaphore(decode_workers)
+        self.recognize_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=recognize_workers, thread_name_prefix="vmt-recognize"
+        )
+        # one per recognizer thread, held until the call running on it really returns
+        self.recognize_slots = asyncio.Semaphore(recognize_workers)
+        self.max_queue = max_queue
+        self.pending = 0
+
+    def is_full(self) -> bool:
+        return self.pending >= self.max_queue
+
+    @contextlib.contextmanager
+    def reserve(self):
+        if self.is_full():
+            raise PoolBusyError(
+                f"{self.pending}/{self.max_queue} transcriptions already queued"
+            )
+
+        self.pending += 1
+        try:
+            yield
+        finally:
+            self.pending -= 1
+
+    async def decode(self, func, *args):
+        # bounds the number of ffmpeg processes running at once
+        async with self.decode_slots:
+            return await func(*args)
+
+    async def reserve_recognizer(self):
+        await self.recognize_slots.acquire()
+
+    def release_recognizer(self):
+        self.recognize_slots.release()
+
+    def recognizer_idle(self) -> bool:
+        return not self.recognize_slots.locked()
+
+    async def recognize(self, func, *args):
+        # runs on a thread taken with reserve_recognizer, which is given back when the
+        # call returns. a cancelled call keeps its thread busy until then
+        loop = asyncio.get_running_loop()
+        future = self.recognize_executor.submit(func, *args)
+        future.add_done_callback(lambda _: self._release_from_thread(loop))
+        return await asyncio.wrap_future(future)
+
+    def _release_from_thread(self, loop: asyncio.AbstractEventLoop):
+        try:
+            loop.call_soon_threadsafe(self.release_recognizer)
+        except RuntimeError:
+            # the loop already closed, nothing is waiting for the thread anymore
+            pass
+
+    def shutdown(self):
+        self.recognize_executor.shutdown(wait=False, cancel_futures=True)
+
+
+class BackgroundQueue:
+    def __init__(self, per_guild: int = 1, max_queued: int = 10):
+        # guild id -> waiting items, taken round robin so one busy server can't starve the rest
+        self.queues = collections.OrderedDict()
+        self.running = collections.Counter()
+        self.per_guild = per_guild
+        self.max_queued = max_queued
+        self.wakeup = asyncio.Event()
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def put(self, guild_id: int, item) -> bool:
+        queue = self.queues.setdefault(guild_id, collections.deque())
+        if len(queue) >= self.max_queued:
+            return False
+
+        queue.append(item)
+        self.wakeup.set()
+        return True
+
+    async def get(self) -> typing.Tuple[int, typing.Any]:
+        while True:
+            for guild_id, queue in list(self.queues.items()):
+                if not queue:
+                    del self.queues[guild_id]
+                    continue
+                if self.running[guild_id] >= self.per_guild:
+                    continue
+
+                # the next get starts with another guild
+                self.queues.move_to_end(guild_id)
+                self.running[guild_id] += 1
+                return guild_id, queue.popleft()
+
+            self.wakeup.clear()
+            await self.wakeup.wait()
+
+    def done(self, guild_id: int):
+        self.running[guild_id] -= 1
+        if self.running[guild_id] <= 0:
+            del self.running[guild_id]
+        self.wakeup.set()